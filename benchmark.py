@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Daniel Berenberg
+
+"""
+Performance benchmarks for the simple_decryption library
+
+Measures, against a training corpus:
+    (1) `score`: SubstitutionSolver.score calls per second on a ciphertext sample
+    (2) `solve`: local search iterations per second of SubstitutionSolver.solve, per strategy
+    (3) `crack`: the distribution of the time it takes to recover seeded random keys, per strategy
+    (4) `build`: n-gram model build time versus corpus size, streamed from files
+    (5) `export`: export_decrypted_text and export_decrypted_stream throughput
+
+Every benchmark prints a summary line; pass --json to also write the raw numbers,
+e.g. to compare them against those of an earlier revision.
+
+usage:
+    python benchmark.py corpus.txt
+    python benchmark.py corpus.txt --dense --benchmarks solve crack --strategies hill anneal
+"""
+import io
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import simple_decryption as sd
+from decipher import exists, intgt0
+
+BENCHMARKS = ["score", "solve", "crack", "build", "export"]
+
+def define_args():
+    """
+    Lays out the passable arguments to the benchmarks
+
+    returns:
+        :(argparse.ArgumentParser) ready to parse the command line
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the simple_decryption library")
+
+    parser.add_argument("training_corpus",
+                        type=exists,
+                        help="path to the training corpus of English texts, or a directory of them")
+
+    parser.add_argument("--benchmarks","-b",
+                        dest="benchmarks",
+                        nargs="+",
+                        choices=BENCHMARKS,
+                        help="the benchmarks to run, defaulted to all of them",
+                        default=BENCHMARKS)
+
+    parser.add_argument("--ngram-width","-g",
+                        dest="ngram",
+                        type=intgt0,
+                        help="The n-gram window size, defaulted to 4",
+                        default=4)
+
+    parser.add_argument("--dense",
+                        dest="dense",
+                        help="benchmark the solver backed by a dense n-gram table (requires numpy)",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--strategies","-s",
+                        dest="strategies",
+                        nargs="+",
+                        choices=sorted(sd.strategy.STRATEGIES),
+                        help="the search strategies to compare in the solve and crack benchmarks, "
+                             "defaulted to hill climbing",
+                        default=["hill"])
+
+    parser.add_argument("--sample",
+                        dest="sample",
+                        type=intgt0,
+                        help="the number of corpus characters encrypted as the benchmark ciphertext, "
+                             "defaulted to 2000",
+                        default=2000)
+
+    parser.add_argument("--iterations","-n",
+                        dest="n_iters",
+                        type=intgt0,
+                        help="the maximum number of iterations per attempt, defaulted to 5000",
+                        default=5000)
+
+    parser.add_argument("--trials",
+                        dest="trials",
+                        type=intgt0,
+                        help="the number of seeded random keys to crack per strategy, defaulted to 10",
+                        default=10)
+
+    parser.add_argument("--max-attempts",
+                        dest="max_attempts",
+                        type=intgt0,
+                        help="give up cracking a key after this many restarts, defaulted to 50",
+                        default=50)
+
+    parser.add_argument("--repeat","-r",
+                        dest="repeat",
+                        type=intgt0,
+                        help="the number of timed repetitions of the score, solve and export "
+                             "benchmarks, of which the best is reported; defaulted to 5",
+                        default=5)
+
+    parser.add_argument("--seed",
+                        dest="seed",
+                        type=int,
+                        help="the random seed, defaulted to 0",
+                        default=0)
+
+    parser.add_argument("--json",
+                        dest="json_file",
+                        type=str,
+                        help="the path to which to write the results as JSON",
+                        default=None)
+
+    return parser
+
+#### timing helpers ####
+def best_time(func, repeat):
+    """
+    time a function a number of times
+    args:
+        :func (callable) - takes no arguments
+        :repeat (int > 0) - the number of times to call it
+    returns:
+        :(float) - the fastest wall-clock time of a call, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def summarize(samples):
+    """
+    args:
+        :samples (list of float) - e.g. timings
+    returns:
+        :(dict) - their min, median, mean and max
+    """
+    return {"min": min(samples), "median": statistics.median(samples),
+            "mean": statistics.mean(samples), "max": max(samples)}
+
+def report(name, message):
+    print(f"[>] {name:<8} {message}")
+
+#### benchmarks ####
+def prepare_solver(cmdline_args, corpus):
+    """
+    build the solver under benchmark from the cleaned corpus
+    args:
+        :cmdline_args (argparse.Namespace) - the commandline arguments
+        :corpus (str) - the cleaned training corpus
+    returns:
+        :(sd.solve.SubstitutionSolver) - the solver
+    """
+    prbs, total = sd.utils.ngram_distribution.__wrapped__(corpus, n=cmdline_args.ngram, log=True)
+    if cmdline_args.dense:
+        table = sd.model.NGramTable.from_distribution(prbs, total, cmdline_args.ngram)
+        return sd.solve.SubstitutionSolver.from_table(table)
+    return sd.solve.SubstitutionSolver(prbs, total, cmdline_args.ngram, log=True)
+
+def bench_score(cmdline_args, solver, plaintext, ciphertext):
+    """
+    SubstitutionSolver.score calls per second on texts decrypted by random keys
+    """
+    keys = [sd.solve.SubstitutionSolver.generate_parent() for _ in range(100)]
+    texts = [sd.core.SubstitutionCipher(key).decrypt(ciphertext) for key in keys]
+    elapsed = best_time(lambda: [solver.score(text) for text in texts], cmdline_args.repeat)
+    result = {"calls_per_sec": len(texts) / elapsed, "chars": len(ciphertext)}
+    report("score", f"{result['calls_per_sec']:,.0f} calls/sec on {len(ciphertext):,} characters")
+    return result
+
+def bench_solve(cmdline_args, solver, plaintext, ciphertext):
+    """
+    iterations and candidate swaps scored per second of SubstitutionSolver.solve, per
+    strategy; strategies perturb rather than stop in local optima, so every run does all
+    its iterations. Steepest ascent scores every swap of the key per iteration, so it
+    runs `n_iters` // NEIGHBORHOOD of them, scoring about as many swaps as the others
+    """
+    result = {}
+    for name in cmdline_args.strategies:
+        steepest = sd.strategy.STRATEGIES[name].steepest
+        n_iters = max(1, cmdline_args.n_iters // sd.solve.NEIGHBORHOOD) if steepest else cmdline_args.n_iters
+        rates, swaps = [], []
+        for _ in range(cmdline_args.repeat):
+            strategy = sd.strategy.STRATEGIES[name](patience=n_iters)
+            start = time.perf_counter()
+            solver.solve(ciphertext, n_iters, strategy=strategy)
+            elapsed = time.perf_counter() - start
+            rates.append(solver.iterations / elapsed)
+            swaps.append(solver.stats.score_calls / elapsed)
+        result[name] = {"iterations": n_iters, "iterations_per_sec": max(rates), "swaps_per_sec": max(swaps)}
+        report("solve", f"{name}: {max(rates):,.0f} iterations/sec, {max(swaps):,.0f} swaps scored/sec")
+    return result
+
+def bench_crack(cmdline_args, solver, plaintext, ciphertext):
+    """
+    the time and restarts it takes each strategy to recover seeded random keys
+    """
+    result = {}
+    for name in cmdline_args.strategies:
+        times, attempts, failures = [], [], 0
+        for trial in range(cmdline_args.trials):
+            random.seed(cmdline_args.seed + trial)
+            cipher = sd.core.SubstitutionCipher(sd.solve.SubstitutionSolver.generate_parent())
+            encrypted = cipher.encrypt(plaintext)
+
+            start = time.perf_counter()
+            for attempt in range(1, cmdline_args.max_attempts + 1):
+                found, _ = solver.solve(encrypted, cmdline_args.n_iters, strategy=sd.strategy.STRATEGIES[name]())
+                if found.decrypt(encrypted) == plaintext:
+                    times.append(time.perf_counter() - start)
+                    attempts.append(attempt)
+                    break
+            else:
+                failures += 1
+
+        result[name] = {"seconds": summarize(times) if times else None,
+                        "attempts": summarize(attempts) if attempts else None,
+                        "failures": failures}
+        if times:
+            report("crack", f"{name}: {len(times)}/{cmdline_args.trials} keys, median "
+                            f"{statistics.median(times):.3f}s (max {max(times):.3f}s), "
+                            f"median {statistics.median(attempts)} attempts")
+        else:
+            report("crack", f"{name}: 0/{cmdline_args.trials} keys")
+    return result
+
+def bench_build(cmdline_args, solver, plaintext, ciphertext, raw):
+    """
+    n-gram model build time versus corpus size, from an eighth of the corpus to all of it;
+    each size is written to a temporary file and built from there, as decipher.py does
+    """
+    result = []
+    with tempfile.TemporaryDirectory() as directory:
+        for fraction in [1/8, 1/4, 1/2, 1]:
+            text = raw[:int(len(raw) * fraction)]
+            path = os.path.join(directory, f"corpus-{len(text)}.txt")
+            with open(path, "wt") as f:
+                f.write(text)
+
+            timings = {"chars": len(text)}
+            start = time.perf_counter()
+            sd.utils.ngram_distribution.__wrapped__(sd.utils.clean(path), n=cmdline_args.ngram, log=True)
+            timings["ngram_distribution"] = time.perf_counter() - start
+            if sd.model.np is not None:
+                start = time.perf_counter()
+                sd.model.NGramModel.from_corpus(path, cmdline_args.ngram)
+                timings["NGramModel"] = time.perf_counter() - start
+            result.append(timings)
+            report("build", ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()
+                                      if name != "chars") + f" on {len(text):,} characters")
+    return result
+
+def bench_export(cmdline_args, solver, plaintext, ciphertext, raw):
+    """
+    decrypted characters per second written by export_decrypted_text and export_decrypted_stream
+    """
+    cipher = sd.core.SubstitutionCipher(sd.solve.SubstitutionSolver.generate_parent())
+    chunks = [raw[i:i + sd.utils.BUFFER_SIZE] for i in range(0, len(raw), sd.utils.BUFFER_SIZE)]
+    exports = {"export_decrypted_text": lambda: sd.core.export_decrypted_text(cipher, raw, file=io.StringIO()),
+               "export_decrypted_stream": lambda: sd.core.export_decrypted_stream(cipher, chunks,
+                                                                                  file=io.StringIO())}
+    result = {}
+    for name, export in exports.items():
+        result[name] = {"chars_per_sec": len(raw) / best_time(export, cmdline_args.repeat)}
+        report("export", f"{name}: {result[name]['chars_per_sec'] / 1e6:,.1f}M chars/sec")
+    return result
+
+def main():
+    parser = define_args()
+    args = parser.parse_args()
+    if args.dense and sd.model.np is None:
+        parser.error("--dense requires numpy (pip install simple_decryption[numpy])")
+    random.seed(args.seed)
+
+    raw = "".join(sd.utils.read_chunks(args.training_corpus))
+    corpus = sd.utils.clean(args.training_corpus)
+    plaintext = corpus[:args.sample]
+    ciphertext = sd.core.SubstitutionCipher(sd.solve.SubstitutionSolver.generate_parent()).encrypt(plaintext)
+    solver = prepare_solver(args, corpus)
+    print(f"[+] Benchmarking {'dense ' if args.dense else ''}{args.ngram}-gram solver, "
+          f"{len(corpus):,} corpus characters")
+
+    results = {"ngram": args.ngram, "dense": args.dense, "sample": args.sample,
+               "n_iters": args.n_iters, "seed": args.seed}
+    benchmarks = {"score": bench_score, "solve": bench_solve, "crack": bench_crack,
+                  "build": lambda *a: bench_build(*a, raw),
+                  "export": lambda *a: bench_export(*a, raw)}
+    for name in BENCHMARKS:
+        if name in args.benchmarks:
+            results[name] = benchmarks[name](args, solver, plaintext, ciphertext)
+
+    if args.json_file is not None:
+        with open(args.json_file, "wt") as f:
+            json.dump(results, f, indent=2)
+        print(f"[>] Wrote results to {args.json_file}")
+
+if __name__ == "__main__":
+    main()
@@ -25,11 +25,15 @@ This script will output two files:
     (2) The original texts decrypted based on (1), defaulted to ./decrypted.txt 
 """
 import re
+import json
+import time
 import string
 import random
+import pstats
+import cProfile
 import sys, os
 import argparse
-import datetime
+import functools
 import simple_decryption as sd
 
 CLEAR = " " * 80
@@ -88,11 +92,12 @@ def define_args():
 
     parser.add_argument("encrypted",
                         type=exists,
-                        help="path to the file containing the ciphertext")
+                        help="path to the file containing the ciphertext, or with --batch the directory "
+                             "or JSON lines file of messages")
 
     parser.add_argument("training_corpus",
                         type=exists,
-                        help="path to the training corpus of English texts")
+                        help="path to the training corpus of English texts, or a directory of them")
 
     parser.add_argument("--cipher-file","-c",
                         dest="cipher_file",
@@ -106,6 +111,73 @@ def define_args():
                         help="the path to which the app will write the decrytpted text",
                         default="decrypted.txt")
 
+    add_model_args(parser)
+    add_search_args(parser)
+
+    parser.add_argument("--patterns",
+                        dest="patterns",
+                        help="first match the ciphertext words against the training vocabulary by their "
+                             "patterns of repeated letters; suited to short messages",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--sample",
+                        dest="sample",
+                        type=intgt0,
+                        help="solve the key from only the first SAMPLE characters of the ciphertext, "
+                             "defaulted to 1048576",
+                        default=1 << 20)
+
+    parser.add_argument("--buffer-size",
+                        dest="buffer_size",
+                        type=intgt0,
+                        help="the number of characters decrypted at a time, defaulted to 1048576",
+                        default=sd.utils.BUFFER_SIZE)
+
+    parser.add_argument("--batch",
+                        dest="batch",
+                        help="solve many independent messages, each under its own key; the encrypted "
+                             "path is a directory with one message per file or a JSON lines file of "
+                             "{\"id\": ..., \"ciphertext\": ...} objects",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--batch-output",
+                        dest="batch_file",
+                        type=str,
+                        help="the path to which the app will write the key and decrypted text of every "
+                             "--batch message as JSON lines, defaulted to decrypted.jsonl",
+                        default="decrypted.jsonl")
+
+    parser.add_argument("--stats",
+                        dest="stats_file",
+                        type=str,
+                        help="the path to which the app will write JSON run statistics: the time spent "
+                             "in each phase and the counters of every attempt",
+                        default=None)
+
+    parser.add_argument("--profile",
+                        dest="profile",
+                        help="profile the run with cProfile and add the most expensive functions to the "
+                             "--stats file",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--verbose","-v",
+                        dest="verbose",
+                        help="Display verbose outputs",
+                        action="store_true",
+                        default=False)
+
+    return parser
+
+def add_model_args(parser):
+    """
+    Lays out the arguments describing the n-gram language model, shared with serve.py
+
+    args:
+        :parser (argparse.ArgumentParser) - the parser to add the arguments to
+    """
     parser.add_argument("--ngram-width","-g",
                         dest="ngram",
                         type=intgt0,
@@ -118,13 +190,106 @@ def define_args():
                         help="directory path to look for/store precomputed ngram log probabilities",
                         default="ngrams")
 
-    parser.add_argument("--verbose","-v",
-                        dest="verbose",
-                        help="Display verbose outputs",
+    parser.add_argument("--dense",
+                        dest="dense",
+                        help="Score keys in ciphertext space against a dense n-gram table (requires numpy)",
                         action="store_true",
                         default=False)
 
-    return parser
+    parser.add_argument("--orders",
+                        dest="orders",
+                        type=intgt0,
+                        nargs="+",
+                        help="solve coarse to fine, climbing with each of these n-gram orders in turn "
+                             "before finishing with the --ngram-width; implies --dense",
+                        default=None)
+
+    parser.add_argument("--smoothing",
+                        dest="smoothing",
+                        choices=sorted(sd.model.SMOOTHINGS),
+                        help="how the dense tables estimate the probabilities of unseen n-grams; a constant "
+                             "floor, add-k or interpolated Kneser-Ney. Implies --dense, defaulted to floor",
+                        default=None)
+
+    parser.add_argument("--build-workers",
+                        dest="build_workers",
+                        type=intgt0,
+                        help="number of processes across which to count shards of the training corpus "
+                             "when building a --dense table, defaulted to 1",
+                        default=1)
+
+def add_search_args(parser):
+    """
+    Lays out the arguments describing the search for a key, shared with serve.py
+
+    args:
+        :parser (argparse.ArgumentParser) - the parser to add the arguments to
+    """
+    parser.add_argument("--start",
+                        dest="start",
+                        choices=["random", "unigram", "bigram"],
+                        help="how to pick the first attempt's key; by aligning unigram (optionally "
+                             "refined by bigram) frequencies with the training corpus, or at random. "
+                             "Defaulted to unigram",
+                        default="unigram")
+
+    parser.add_argument("--iterations","-n",
+                        dest="n_iters",
+                        type=intgt0,
+                        help="the maximum number of iterations per attempt, defaulted to 5000",
+                        default=5000)
+
+    parser.add_argument("--stagnation",
+                        dest="stagnation",
+                        type=intgt0,
+                        help="stop an attempt after this many iterations without improvement",
+                        default=None)
+
+    parser.add_argument("--deadline",
+                        dest="deadline",
+                        type=float,
+                        help="stop an attempt after this many seconds",
+                        default=None)
+
+    parser.add_argument("--strategy","-s",
+                        dest="strategy",
+                        choices=sorted(sd.strategy.STRATEGIES),
+                        help="the local search strategy, defaulted to hill climbing. Steepest ascent "
+                             "scores all 325 swaps of the key per iteration, each over only the n-grams "
+                             "it touches, which is cheapest against a dense table, so it implies --dense "
+                             "(and numpy)",
+                        default="hill")
+
+    parser.add_argument("--schedule",
+                        dest="schedule",
+                        choices=sorted(sd.strategy.SCHEDULES),
+                        help="the simulated annealing temperature schedule, defaulted to exponential",
+                        default="exponential")
+
+    parser.add_argument("--temperature","-t",
+                        dest="temperature",
+                        type=float,
+                        help="the initial simulated annealing temperature, defaulted to 10",
+                        default=10.0)
+
+    parser.add_argument("--patience","-p",
+                        dest="patience",
+                        type=intgt0,
+                        help="perturb the search after this many iterations without improvement",
+                        default=None)
+
+    parser.add_argument("--workers","-w",
+                        dest="workers",
+                        type=intgt0,
+                        help="number of processes to run restarts across, defaulted to 1",
+                        default=1)
+
+    parser.add_argument("--max-attempts",
+                        dest="max_attempts",
+                        type=intgt0,
+                        help="give up on a --batch or served message after this many attempts, keeping "
+                             "its fittest key; defaulted to 10",
+                        default=10)
 
 def prepare_solver(cmdline_args):
     """
@@ -133,23 +298,120 @@ def prepare_solver(cmdline_args):
     args:
         :cmdline_args (argparse.Namespace) - the commandline arguments
     returns:
-        :(sd.solve.SubstitutionSolver) - Solver object storing the data computed
-        :(set of str) - the vocabulary of the training corpus 
+        :(sd.solve.SubstitutionSolver or sd.solve.StagedSubstitutionSolver) - Solver object storing the data computed
+        :(collections.Counter) - the vocabulary of the training corpus, with the occurrences of every word
     """
-    # build the path to the ngram file that will be used
-    ngram_file = os.path.join(cmdline_args.ngram_dir, f"{cmdline_args.ngram}-grams.bin")
-    
-    # get the log probabilties of ngrams in the training corpus
+    # build the paths to the ngram and vocabulary files that will be used, keyed by the
+    # corpus contents and the parameters they are computed with
+    params = dict(n=cmdline_args.ngram, log=True, filt=sd.utils.FILTER)
+    smoothing = sd.model.SMOOTHINGS[cmdline_args.smoothing or "floor"]()
+    ngram_file = sd.utils.cache_filename(cmdline_args.ngram_dir, f"{cmdline_args.ngram}-grams",
+                                         cmdline_args.training_corpus, "bin", **params)
+    model_file = sd.utils.cache_filename(cmdline_args.ngram_dir, f"1-{cmdline_args.ngram}-grams",
+                                         cmdline_args.training_corpus, "model", smoothing=str(smoothing),
+                                         version=sd.model.VERSION, **params)
+    vocab_file = sd.utils.cache_filename(cmdline_args.ngram_dir, "vocab", cmdline_args.training_corpus,
+                                         "bin", filt=sd.utils.FILTER, counts=True)
+
+    # the corpus is only read, streaming, if something is not cached
     if cmdline_args.verbose:
         print(f"\r{CLEAR}\r[+] Building {cmdline_args.ngram}-gram language model", end="")
-    cleaned, vocab = sd.utils.clean(cmdline_args.training_corpus,return_vocab=True)
-        
-    prbs, total_ngrams = sd.utils.ngram_distribution(ngram_file, cleaned, n=cmdline_args.ngram, log=True)
+    vocab = sd.utils.cached(vocab_file, lambda: sd.utils.vocabulary(cmdline_args.training_corpus, counts=True))
+
+    # get the log probabilties of ngrams in the training corpus
+    if cmdline_args.dense or cmdline_args.orders or cmdline_args.smoothing:
+        # the dense tables of every order up to the n-gram width are counted in one
+        # pass in constant memory and cached in the binary model format, memory
+        # mapped on later runs
+        try:
+            model = sd.model.NGramModel.load(model_file)
+        except FileNotFoundError:
+            if cmdline_args.build_workers > 1:
+                shards = sd.model.corpus_shards(cmdline_args.training_corpus, cmdline_args.build_workers)
+                model = sd.model.NGramModel.from_shards(shards, cmdline_args.ngram, smoothing=smoothing,
+                                                        workers=cmdline_args.build_workers)
+            else:
+                model = sd.model.NGramModel.from_corpus(cmdline_args.training_corpus, cmdline_args.ngram,
+                                                        smoothing=smoothing)
+            model.save(model_file)
+        if cmdline_args.orders:
+            orders = sorted(set(cmdline_args.orders) | {cmdline_args.ngram})
+            solver = sd.solve.StagedSubstitutionSolver.from_model(model, orders)
+        else:
+            solver = sd.solve.SubstitutionSolver.from_table(model[cmdline_args.ngram])
+    else:
+        count = sd.utils.ngram_distribution.__wrapped__ # the undecorated, uncached counter
+        prbs, total_ngrams = sd.utils.cached(ngram_file, lambda: count(sd.utils.clean(cmdline_args.training_corpus),
+                                                                       n=cmdline_args.ngram, log=True))
+        solver = sd.solve.SubstitutionSolver(prbs, total_ngrams, cmdline_args.ngram, log=True)
+
     if cmdline_args.verbose:
         print(f"\r{CLEAR}\r[+] Extracted {cmdline_args.ngram}-grams from {cmdline_args.training_corpus}")
-
-    return sd.solve.SubstitutionSolver(prbs, total_ngrams, cmdline_args.ngram), vocab
+    return solver, vocab
     
+def check_strategy(parser, cmdline_args):
+    """
+    Validate the search strategy of the command line and that numpy is installed for every
+    option that needs the dense model; steepest ascent scores every swap of the key per
+    iteration, each over only the n-grams it touches, and the per-n-gram lookups of an
+    n-gram dictionary make that several to tens of times slower, growing with the text,
+    than against a dense table, so it is upgraded to --dense
+
+    args:
+        :parser (argparse.ArgumentParser) - the parser, to report errors with
+        :cmdline_args (argparse.Namespace) - the commandline arguments, updated in place
+    """
+    dense = [option for option, given in (("--dense", cmdline_args.dense),
+                                          ("--orders", cmdline_args.orders),
+                                          ("--smoothing", cmdline_args.smoothing),
+                                          ("--strategy steepest", cmdline_args.strategy == "steepest"))
+             if given]
+    if dense and sd.model.np is None:
+        parser.error(f"{', '.join(dense)} requires numpy (pip install simple_decryption[numpy])")
+    if dense == ["--strategy steepest"]:
+        cmdline_args.dense = True
+        if cmdline_args.verbose:
+            print("[+] --strategy steepest implies --dense")
+
+def prepare_strategy(cmdline_args):
+    """
+    Build the search strategy described by the command line
+
+    args:
+        :cmdline_args (argparse.Namespace) - the commandline arguments
+    returns:
+        :(sd.strategy.SearchStrategy) - the search strategy
+    """
+    if cmdline_args.strategy == "anneal":
+        schedule = sd.strategy.SCHEDULES[cmdline_args.schedule](t0=cmdline_args.temperature)
+        return sd.strategy.SimulatedAnnealing(schedule, patience=cmdline_args.patience)
+    return sd.strategy.STRATEGIES[cmdline_args.strategy](patience=cmdline_args.patience)
+
+def double_space(chunks):
+    """
+    reformat streamed text so that blank lines are dropped and every other
+    line is followed by a single blank line
+
+    args:
+        :chunks (iterable of str) - the text, split anywhere
+    yields:
+        :(str) the reformatted chunks
+    """
+    in_line = False # whether the current line has any content yet
+    for chunk in chunks:
+        out = []
+        pieces = chunk.split("\n")
+        for i, piece in enumerate(pieces):
+            out.append(piece)
+            in_line = in_line or bool(piece)
+            if i < len(pieces) - 1 and in_line: # a newline ends the non-empty line
+                out.append("\n\n")
+                in_line = False
+        yield "".join(out)
+
+    if in_line: # the last line had no newline of its own
+        yield "\n"
+
 def export_data(cmdline_args, cipher):
     """
     helper function to write final results to disk
@@ -157,13 +419,31 @@ def export_data(cmdline_args, cipher):
         :cmdline_args (argparse.Namespace) - the original cmdline args
         :cipher (str) - the final cipher
     """
-    with open(cmdline_args.encrypted, "rt") as infile, open(cmdline_args.decryption_file, "wt") as outfile:
-        for line in filter(lambda l: l != "\n", infile.readlines()):
-            sd.core.export_decrypted_text(cipher, line, file=outfile)
+    chunks = sd.utils.read_chunks(cmdline_args.encrypted, size=cmdline_args.buffer_size)
+    with open(cmdline_args.decryption_file, "wt") as outfile:
+        sd.core.export_decrypted_stream(cipher, double_space(chunks), file=outfile)
 
     with open(cmdline_args.cipher_file, "wt") as cf:
         sd.core.export_cipher(cipher, file=cf)
 
+def export_stats(cmdline_args, stats, profiler=None, top=25):
+    """
+    helper function to write run statistics to disk as JSON
+    args:
+        :cmdline_args (argparse.Namespace) - the original cmdline args
+        :stats (dict) - the statistics gathered by `main`
+        :profiler (cProfile.Profile, optional) - the profile of the run
+        :top (int > 0) - the number of functions of the profile to write, by cumulative time
+    """
+    if profiler is not None:
+        profile = pstats.Stats(profiler).stats # (file, line, function) --> timings
+        functions = sorted(profile.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        stats["profile"] = [{"function": f"{filename}:{line}({function})",
+                             "calls": calls, "tottime": tottime, "cumtime": cumtime}
+                            for (filename, line, function), (_, calls, tottime, cumtime, _) in functions]
+    with open(cmdline_args.stats_file, "wt") as sf:
+        json.dump(stats, sf, indent=2)
+
 def mean(L):
     """
     return the mean of a list
@@ -185,37 +465,142 @@ def proportion_english_text(english_vocab, test_vocab, cipher):
     decrypted_texts = set(cipher.decrypt(w) for w in test_vocab)
     return mean([1 if w in english_vocab else 0 for w in decrypted_texts])
 
+def is_english(english_vocab, test_vocab, cipher, threshold=0.95):
+    """
+    verify that at least `threshold` of the decrypted `test_vocab` is English
+
+    args:
+        :english_vocab, test_vocab (set of str) - the texts to verify
+        :cipher (sd.core.SubstitutionCipher) - the cipher to decrypt the test text
+        :threshold (float, optional) - the minimum proportion of English text
+    returns:
+        :(bool) - whether the decrypted text passes as English
+    """
+    return proportion_english_text(english_vocab, test_vocab, cipher) >= threshold
+
+def solve_batch(cmdline_args, solver, english_vocab, options):
+    """
+    solve every message of a --batch and write the results to disk as JSON lines
+    args:
+        :cmdline_args (argparse.Namespace) - the original cmdline args
+        :solver (sd.solve.SubstitutionSolver) - the solver shared by every message
+        :english_vocab (collections.Counter) - the vocabulary of the training corpus
+        :options (dict) - keyword arguments of the solver's `solve`
+    returns:
+        :(int) - the number of messages
+        :(int) - the number of those whose key was accepted
+    """
+    patterns = sd.solve.PatternSubstitutionSolver(english_vocab, solver) if cmdline_args.patterns else None
+    batch = sd.solve.BatchSubstitutionSolver(solver, workers=cmdline_args.workers, patterns=patterns)
+    messages = list(sd.utils.read_messages(cmdline_args.encrypted))
+    accept = functools.partial(is_english, english_vocab)
+    results = batch.solve(messages, cmdline_args.n_iters, accept, max_attempts=cmdline_args.max_attempts,
+                          start=cmdline_args.start, **options)
+
+    solved = 0
+    with open(cmdline_args.batch_file, "wt") as outfile:
+        for (message_id, text), (_, cipher, fitness, attempts, accepted) in zip(messages, results):
+            solved += accepted
+            json.dump({"id": message_id, "key": cipher.key, "fitness": fitness, "attempts": attempts,
+                       "accepted": accepted, "plaintext": cipher.decrypt(text, preserve_case=True)}, outfile)
+            outfile.write("\n")
+            if cmdline_args.verbose:
+                print(f"\r{CLEAR}\r[+] Solved {message_id} ({attempts} attempts)", end="")
+    return len(messages), solved
+
 def main():
 
     # parse command line arguments
-    args = define_args().parse_args()
-    args.n_iters = 5000
-    # clean the test corpus for the algorithm to decode
-    test_corpus, encrypted_vocab = sd.utils.clean(args.encrypted, return_vocab=True)
+    parser = define_args()
+    args = parser.parse_args()
+    if args.orders and max(args.orders) > args.ngram:
+        parser.error(f"--orders cannot exceed the n-gram width {args.ngram}")
+    if args.profile and args.stats_file is None:
+        parser.error("--profile requires --stats")
+    if args.batch and args.stats_file is not None:
+        parser.error("--stats does not support --batch")
+    check_strategy(parser, args)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    stats = dict(seconds={}, attempts=[]) # written to --stats
     # obtain a du.Solver object for decryption
 
-    # iteratively solve the same problem for 1, 2, 3, and 4-gram language models
-    # each solver builds its solution with the key seeded by its predecessor
-    then = datetime.datetime.now()
+    # with --orders, iteratively solve the same problem for e.g. 1, 2, 3, and 4-gram language
+    # models; each solver builds its solution with the key seeded by its predecessor
+    then = time.perf_counter()
 
-    key = sd.solve.SubstitutionSolver.generate_parent() # initial key
     solver, english_vocab = prepare_solver(args)        # generate the handler that will find solution
+    stats["seconds"]["prepare"] = time.perf_counter() - then
+    options = dict(strategy=prepare_strategy(args),     # how the solver explores the keys
+                   stagnation=args.stagnation,          # and when it gives up
+                   deadline=args.deadline,
+                   timings=args.stats_file is not None) # time the phases only for --stats
+    if args.batch:
+        total, solved = solve_batch(args, solver, english_vocab, options)
+        elapsed = time.perf_counter() - then
+        print(f"\r{CLEAR}\r[>] Decrypted {solved} of {total} messages in {elapsed:.2f} seconds.")
+        print(f"[>] Wrote keys and decrypted texts to {args.batch_file}")
+        return
+
+    # clean (a bounded sample of) the test corpus for the algorithm to decode
+    test_corpus, encrypted_vocab = sd.utils.clean(args.encrypted, return_vocab=True, limit=args.sample)
+    if not test_corpus or not encrypted_vocab:
+        parser.error(f"{args.encrypted} has no letters to decrypt in its first {args.sample} characters")
+    if args.start == "random":
+        key = sd.solve.SubstitutionSolver.generate_parent() # initial key
+    else:
+        key = solver.frequency_parent(test_corpus, bigrams=args.start == "bigram")
     cipher = sd.core.SubstitutionCipher(key)            # the initial cipher
     
-    iter_ct = 0
+    iter_ct, fitness = 0, None
     # the encrypted texts are known to be correct, English prose. We can use
     # the corpus text to verify that the decrypted vocabulary is reasonable
     # by making it function as a dictionary
-    while proportion_english_text(english_vocab, encrypted_vocab, cipher) < 0.95:
-        cipher, fitness = solver.solve(test_corpus, args.n_iters, verbose=args.verbose) #seed_parent=cipher.key)
+    accept = functools.partial(is_english, english_vocab, encrypted_vocab)
+    if args.patterns: # a dictionary attack on the word patterns, refined by a climb
+        patterns = sd.solve.PatternSubstitutionSolver(english_vocab, solver)
+        cipher, fitness = patterns.solve(test_corpus, encrypted_vocab, args.n_iters,
+                                         verbose=args.verbose, **options)
+        if patterns.stats is not None:
+            stats["attempts"].append(patterns.stats.as_dict())
+        iter_ct += 1
+
+    if args.start != "random" and not accept(cipher):
+        # climb from the frequency analysis key once before restarting at random
+        cipher, fitness = solver.solve(test_corpus, args.n_iters, verbose=args.verbose,
+                                       seed_parent=key, **options)
+        stats["attempts"].append(solver.stats.as_dict())
+        iter_ct += 1
+
+    if args.workers > 1 and not accept(cipher):
+        parallel = sd.solve.ParallelSubstitutionSolver(solver, workers=args.workers)
+        cipher, fitness, attempts = parallel.solve(test_corpus, args.n_iters, accept,
+                                                   verbose=args.verbose, **options)
+        iter_ct += attempts
+
+    while not accept(cipher):
+        cipher, fitness = solver.solve(test_corpus, args.n_iters, verbose=args.verbose,
+                                       **options) #seed_parent=cipher.key)
+        stats["attempts"].append(solver.stats.as_dict())
         iter_ct +=1
 
-    elapsed = (datetime.datetime.now() - then).seconds
+    elapsed = time.perf_counter() - then
+    stats["seconds"]["solve"] = elapsed - stats["seconds"]["prepare"]
 
     grammar = {True: "attempts", False: "attempt"}  # print with correct gram
-    print(f"\r{CLEAR}\r[>] Decrypted texts in {elapsed} seconds ({iter_ct} {grammar[iter_ct > 1]}).")
+    print(f"\r{CLEAR}\r[>] Decrypted texts in {elapsed:.2f} seconds ({iter_ct} {grammar[iter_ct > 1]}).")
+    exported = time.perf_counter()
     export_data(args, cipher)
+    stats["seconds"]["export"] = time.perf_counter() - exported
     print(f"[>] Wrote cipher to {args.cipher_file}, decrypted texts to {args.decryption_file}")
 
+    if args.stats_file is not None:
+        if profiler is not None:
+            profiler.disable()
+        stats.update(total_attempts=iter_ct, fitness=fitness)
+        export_stats(args, stats, profiler)
+        print(f"[>] Wrote run statistics to {args.stats_file}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Daniel Berenberg
+
+"""
+User facing command line application for serving substitution cipher solves
+
+Loads the n-gram language model once and then serves solve and decrypt requests
+over HTTP on a local port or Unix socket, so that every request costs only its
+own solve rather than interpreter start up, imports and model loading:
+
+    $ python serve.py corpus.txt --dense --socket /tmp/decipher.sock
+    $ curl --unix-socket /tmp/decipher.sock localhost/solve -d '{"ciphertext": "..."}'
+
+See simple_decryption.service for the endpoints.
+"""
+import asyncio
+import argparse
+import functools
+import simple_decryption as sd
+from decipher import exists, add_model_args, add_search_args, check_strategy, prepare_solver, prepare_strategy, is_english
+
+def define_args():
+    """
+    Lays out the passable arguments to the application
+
+    returns:
+        :(argparse.ArgumentParser) ready to parse the command line
+    """
+    parser = argparse.ArgumentParser(description="Serve substitution cipher solves")
+
+    parser.add_argument("training_corpus",
+                        type=exists,
+                        help="path to the training corpus of English texts, or a directory of them")
+
+    parser.add_argument("--socket",
+                        dest="socket",
+                        type=str,
+                        help="serve on a Unix socket at this path rather than over TCP",
+                        default=None)
+
+    parser.add_argument("--host",
+                        dest="host",
+                        type=str,
+                        help="the TCP host to serve on, defaulted to 127.0.0.1",
+                        default="127.0.0.1")
+
+    parser.add_argument("--port",
+                        dest="port",
+                        type=int,
+                        help="the TCP port to serve on, defaulted to 8000",
+                        default=8000)
+
+    add_model_args(parser)
+    add_search_args(parser)
+
+    parser.add_argument("--verbose","-v",
+                        dest="verbose",
+                        help="Display verbose outputs",
+                        action="store_true",
+                        default=False)
+
+    return parser
+
+def main():
+    parser = define_args()
+    args = parser.parse_args()
+    if args.orders and max(args.orders) > args.ngram:
+        parser.error(f"--orders cannot exceed the n-gram width {args.ngram}")
+    check_strategy(parser, args)
+
+    solver, english_vocab = prepare_solver(args)
+    service = sd.service.SolverService(solver, accept=functools.partial(is_english, english_vocab),
+                                       workers=args.workers, n_iters=args.n_iters,
+                                       max_attempts=args.max_attempts, start=args.start,
+                                       strategy=prepare_strategy(args), stagnation=args.stagnation,
+                                       deadline=args.deadline)
+
+    address = args.socket or f"http://{args.host}:{args.port}"
+    print(f"[>] Serving {solver.gram_len}-gram solves with {service.workers} workers on {address}")
+    asyncio.run(service.serve(path=args.socket, host=args.host, port=args.port))
+    print("[>] Stopped")
+
+if __name__ == "__main__":
+    main()
@@ -4,5 +4,7 @@ setuptools.setup(name="simple_decryption",
                  version="1.0",
                  author="Daniel Berenberg",
                  description="Decrypt ciphertext",
-                 packages=setuptools.find_packages()
+                 packages=setuptools.find_packages(),
+                 python_requires=">=3.10",
+                 extras_require={"numpy": ["numpy"]}
                  )
@@ -1,3 +1,6 @@
 from . import core
 from . import utils
 from . import solve
+from . import model
+from . import strategy
+from . import service
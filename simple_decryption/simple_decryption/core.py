@@ -12,7 +12,8 @@ from collections import Counter
 from .utils import cache_pickle, chunks
 
 __all__ = ["SubstitutionCipher","AbstractCipher", 
-           "export_cipher","export_decrypted_text"]
+           "export_cipher","export_decrypted_text",
+           "decrypt_chunks","export_decrypted_stream"]
 
 
 #### cipher object hierarchy ####
@@ -27,10 +28,10 @@ class AbstractCipher(object):
     their the key they use to encrypt/decrypt texts
     """
 
-    def encrypt(self, msg):
+    def encrypt(self, msg, preserve_case=False):
         raise NotImplementedError
 
-    def decrypt(self, msg):
+    def decrypt(self, msg, preserve_case=False):
         raise NotImplementedError
 
     @property
@@ -86,6 +87,65 @@ class SubstitutionCipher(AbstractCipher):
         self.k2a = dict(zip(self._k, self._alph)) # key      --> alphabet 
         self.a2k = dict(zip(self._alph, self._k)) # alphabet --> key
 
+        # translation tables for str.translate and bytes.translate, keyed by direction and
+        # whether they also map upper case letters; characters outside of the mapping are left as is
+        self._tables = {}
+        for direction, mapping in [("encrypt", self.k2a), ("decrypt", self.a2k)]:
+            for preserve_case in [False, True]:
+                if preserve_case:
+                    mapping = self.case_mapping(mapping)
+                self._tables[direction, preserve_case] = (str.maketrans(mapping), self.bytes_table(mapping))
+
+    @staticmethod
+    def case_mapping(mapping):
+        """
+        extend a character mapping with the upper case analogs of its characters,
+        e.g. {"a": "x"} -> {"a": "x", "A": "X"}
+        args:
+            :mapping (dict) - single character --> single character
+        returns:
+            :(dict) - the extended mapping
+        """
+        cased = dict(mapping)
+        for frm, to in mapping.items():
+            if len(frm.upper()) == len(to.upper()) == 1:
+                cased.setdefault(frm.upper(), to.upper())
+        return cased
+
+    @staticmethod
+    def bytes_table(mapping):
+        """
+        build a bytes.translate table from a character mapping
+        args:
+            :mapping (dict) - single character --> single character
+        returns:
+            :(bytes or NoneType) - the table, or None if some character is not a single byte
+        """
+        try:
+            frm, to = ("".join(chars).encode("latin-1") for chars in zip(*mapping.items()))
+        except (UnicodeEncodeError, ValueError):
+            return None
+        return bytes.maketrans(frm, to)
+
+    @classmethod
+    def translate(cls, msg, table, bytes_table):
+        """
+        internal method to encrypt/decrypt a message with respect to some translation table
+        args:
+            :msg (str, bytes or bytearray) - the message, casted to string if it is not bytes
+            :table (dict) - str.translate table
+            :bytes_table (bytes or NoneType) - bytes.translate table
+        returns:
+            :(str, bytes or bytearray) - the mapped message, of the same type as a bytes input
+        raises:
+            :TypeError if `msg` is bytes but the mapping is not over single bytes
+        """
+        if isinstance(msg, (bytes, bytearray)):
+            if bytes_table is None:
+                raise TypeError("Cannot translate bytes; the cipher maps characters outside of latin-1")
+            return msg.translate(bytes_table)
+        return str(msg).translate(table)
+
     @property
     def key(self):
         return "".join(self._k)
@@ -95,44 +155,44 @@ class SubstitutionCipher(AbstractCipher):
         return "".join(self._alph)
     
 
-    def encrypt(self, msg):
+    def encrypt(self, msg, preserve_case=False):
         """
         Encrypt a message using the supplied key. For each character in the message, 
         if that character is mappable onto the cipher alphabet, that will be done.
         If the character is not mappable, just ignore it and continue
 
         args:
-            :msg (str) - the message to encrypt; message will be casted to string on input
+            :msg (str or bytes) - the message to encrypt; non-bytes messages will be casted to string on input
+            :preserve_case (bool) - also map upper case letters, to upper case
         returns:
-            :(str) - the encrypted message
+            :(str or bytes) - the encrypted message
         """
-        msg = str(msg)
-        return "".join(self.encode(ch, self.k2a) for ch in msg)
+        return self.translate(msg, *self._tables["encrypt", preserve_case])
 
-    def decrypt(self, msg):
+    def decrypt(self, msg, preserve_case=False):
         """
         Decrypt a message with respect to the supplied key. Step through the `msg` string
         and map characters to their decrypted analog if possible
 
         args:
-            :msg (str) - the message to decrypt, casted to string on input
+            :msg (str or bytes) - the message to decrypt, non-bytes messages are casted to string on input
+            :preserve_case (bool) - also map upper case letters, to upper case
         returns:
-            (str) - the decrypted message
+            (str or bytes) - the decrypted message
         """
-        msg = str(msg)
-        return "".join(self.encode(ch, self.a2k) for ch in msg)
+        return self.translate(msg, *self._tables["decrypt", preserve_case])
 
 
 
 # cleanly export of texts/ciphers
 def export_decrypted_text(cipher, text, **kwargs):
     """
-    export decrypted text to a string for later output
+    export decrypted text to a string for later output, preserving its case
     
     Supply keyword arguments for print() functionality
     args:
         :cipher (inherits .core.AbstractCipher) - the decryption cipher to use
-        :text (str) - text to decipher
+        :text (str) - text to decipher; whole lines or buffers are decrypted in one pass
 
     returns:
         :None
@@ -143,18 +203,41 @@ def export_decrypted_text(cipher, text, **kwargs):
     if not isinstance(cipher, AbstractCipher):
         raise TypeError("Expected cipher object")
 
-    final_str = ""
-    for ch in text:
-        dec = cipher.decrypt(ch.lower())
-        if ch.isalpha():
-            if ch.isupper():
-                final_str += dec.upper() 
-            else:
-                final_str += dec
-        else:
-            final_str += ch
-    
-    print(final_str, **kwargs)
+    print(cipher.decrypt(text, preserve_case=True), **kwargs)
+
+def decrypt_chunks(cipher, stream):
+    """
+    lazily decrypt a stream of text, preserving its case
+
+    Substitution maps every character independently, so the chunks may be split
+    anywhere and only one chunk is held in memory at a time
+    args:
+        :cipher (inherits .core.AbstractCipher) - the decryption cipher to use
+        :stream (iterable of str) - the text to decipher, e.g. from .utils.read_chunks
+    yields:
+        :(str) the decrypted chunks, in order
+    raises:
+        :TypeError if cipher is not a child of .core.AbstractCipher
+    """
+    if not isinstance(cipher, AbstractCipher):
+        raise TypeError("Expected cipher object")
+    for chunk in stream:
+        yield cipher.decrypt(chunk, preserve_case=True)
+
+def export_decrypted_stream(cipher, stream, file=None):
+    """
+    export a stream of decrypted text chunk by chunk, preserving its case
+    args:
+        :cipher (inherits .core.AbstractCipher) - the decryption cipher to use
+        :stream (iterable of str) - the text to decipher, e.g. from .utils.read_chunks
+        :file (file-like, optional) - where to write the decrypted text, defaults to sys.stdout
+    returns:
+        :None
+    raises:
+        :TypeError if cipher is not a child of .core.AbstractCipher
+    """
+    for chunk in decrypt_chunks(cipher, stream):
+        print(chunk, end="", file=file)
 
 def export_cipher(cipher, **kwargs):
     """
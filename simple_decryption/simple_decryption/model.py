@@ -0,0 +1,776 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Daniel Berenberg
+"""
+simple_decryption language model library. Contains dense, array-backed
+n-gram tables for fast vectorized scoring.
+
+The tables in this module require numpy; install it with
+    `pip install --upgrade ./simple_decryption[numpy]`
+"""
+import os
+import re
+import string
+import struct
+from math import log2
+from .utils import atomic_write, corpus_files, read_chunks, read_range, BUFFER_SIZE, FILTER
+
+try:
+    import numpy as np
+except ImportError: # numpy is optional, only the dense tables need it
+    np = None
+
+__all__ = ["NGramTable", "NGramModel", "corpus_shards",
+           "Smoothing", "ConstantFloor", "AddK", "KneserNey", "SMOOTHINGS"]
+
+# binary model format, all little-endian:
+#   header   - magic, format version, n, alphabet length, flags, total n-gram count, floor
+#   alphabet - `alphabet length` ASCII characters, zero padded to a multiple of 8 bytes
+#   body     - `alphabet length`**n float32 log probabilities indexed by n-gram code
+#   seen     - with the FLAG_SEEN flag, a bit per n-gram code (numpy.packbits order), set if
+#              the n-gram occurred in the training corpus
+MAGIC = b"SDNG"
+VERSION = 2
+VERSIONS = (1, 2) # the versions `load` reads; version 1 files have no flags
+HEADER = struct.Struct("<4sHHHHQd")
+FLAG_SEEN = 1
+
+
+def require_numpy():
+    """
+    raises:
+        :ImportError if numpy is not installed
+    """
+    if np is None:
+        raise ImportError("numpy is required for dense n-gram tables; "
+                          "pip install --upgrade ./simple_decryption[numpy]")
+
+class NGramTable(object):
+    """
+    Dense n-gram (log) probability table
+
+    Every n-gram over the alphabet is encoded as a base-`len(alphabet)` integer,
+    e.g. for the lowercase alphabet and n = 2, "ab" -> 0*26 + 1 = 1, which indexes
+    a flat float32 array of size `len(alphabet)**n`. N-grams that never occurred
+    in the training corpus hold a smoothed estimate, at least `floor`; which ones
+    occurred is kept in a bitmask, `seen`.
+
+    Scoring a text is then a single fancy-index-and-sum over the codes of all of
+    its n-grams rather than one dictionary lookup per n-gram.
+    """
+
+    def __init__(self, logprobs, n, floor, alphabet=string.ascii_lowercase, total=None, seen=None):
+        """
+        args:
+            :logprobs (numpy.ndarray) - flat array of size `len(alphabet)**n` of n-gram log probabilities
+            :n (int > 0) - the length of the n-grams
+            :floor (float) - the log probability of the least likely n-grams
+            :alphabet (str, optional) - the alphabet the n-grams are drawn from
+            :total (int, optional) - the total number of n-grams in the training corpus
+            :seen (numpy.ndarray of uint8, optional) - a bit per n-gram code, packed by numpy.packbits,
+                                                       set if the n-gram occurred in the training corpus;
+                                                       without it, n-grams at `floor` count as unseen
+        raises:
+            :ImportError if numpy is not installed
+            :ValueError if `logprobs` has the wrong size
+        """
+        require_numpy()
+        if len(logprobs) != len(alphabet) ** n:
+            raise ValueError(f"Expected {len(alphabet)**n} log probabilities; got {len(logprobs)}")
+
+        self.logprobs = logprobs
+        self.n = n
+        self.floor = floor
+        self.alphabet = alphabet
+        self.total = total
+        self.seen = seen
+        self.base = len(alphabet)
+
+        # byte value --> alphabet index; anything outside the alphabet maps past its end
+        self._lookup = np.full(256, self.base, dtype=np.uint8)
+        for i, ch in enumerate(alphabet):
+            self._lookup[ord(ch)] = i
+        self._place = self.base ** np.arange(n - 1, -1, -1, dtype=np.int64)
+
+    @classmethod
+    def from_distribution(cls, ngram_distribution, total_ngrams, n, alphabet=string.ascii_lowercase):
+        """
+        build a dense table from the output of .utils.ngram_distribution
+
+        args:
+            :ngram_distribution (dict) - mapping from ngrams -> their log probabilities
+            :total_ngrams (int) - the total number of ngrams found in the corpus text
+            :n (int > 0) - the length of the ngrams in `ngram_distribution`
+            :alphabet (str, optional) - the alphabet the n-grams are drawn from
+        returns:
+            :(NGramTable) - the dense table; unseen n-grams score log2(0.0001/total_ngrams)
+        """
+        require_numpy()
+        floor = log2(0.0001/total_ngrams)
+        logprobs = np.full(len(alphabet) ** n, floor, dtype=np.float32)
+
+        table = cls(logprobs, n, floor, alphabet=alphabet, total=total_ngrams)
+        grams = [gram for gram in ngram_distribution if len(gram) == n]
+        seen = np.zeros(len(logprobs), dtype=bool)
+        if grams:
+            codes = table.codes(table.encode("".join(grams)))[::n]
+            logprobs[codes] = [ngram_distribution[gram] for gram in grams]
+            seen[codes] = True
+        table.seen = np.packbits(seen)
+        return table
+
+    @classmethod
+    def from_counts(cls, counts, n, alphabet=string.ascii_lowercase):
+        """
+        build a dense table from n-gram counts, e.g. the output of `count`
+
+        args:
+            :counts (numpy.ndarray) - flat integer array of size `len(alphabet)**n` of n-gram counts
+            :n (int > 0) - the length of the n-grams
+            :alphabet (str, optional) - the alphabet the n-grams are drawn from
+        returns:
+            :(NGramTable) - the dense table; unseen n-grams score log2(0.0001/total n-grams)
+        """
+        require_numpy()
+        table = cls(np.empty(len(alphabet) ** n, dtype=np.float32), n, 0.0, alphabet=alphabet)
+        table.set_counts(counts)
+        return table
+
+    @classmethod
+    def from_corpus(cls, filename, n, filt=FILTER, alphabet=string.ascii_lowercase, size=BUFFER_SIZE):
+        """
+        build a dense table by streaming a training corpus; equivalent to
+        .utils.ngram_distribution of the .utils.clean(ed) corpus, but in constant memory
+
+        args:
+            :filename (str) - preverified path to the training corpus
+            :n (int > 0) - the length of the n-grams
+            :filt (str, regex) - the characters to remove, as in .utils.clean;
+                                 whatever remains must lowercase into `alphabet`
+            :alphabet (str, optional) - the alphabet the n-grams are drawn from
+            :size (int > 0, optional) - the number of characters read at a time
+        returns:
+            :(NGramTable) - the dense table
+        """
+        require_numpy()
+        table = cls(np.empty(len(alphabet) ** n, dtype=np.float32), n, 0.0, alphabet=alphabet)
+        table.set_counts(table.count(read_chunks(filename, size), filt=filt))
+        return table
+
+    def count(self, chunks, filt=FILTER, return_tail=False):
+        """
+        count the n-grams of a stream of raw text into an integer array indexed by
+        n-gram code. Each chunk is cleaned on its own and the last n-1 characters of
+        each cleaned chunk carry over, so n-grams spanning chunk boundaries are counted
+
+        args:
+            :chunks (iterable of str) - the raw text, e.g. from .utils.read_chunks
+            :filt (str, regex) - the characters to remove, as in .utils.clean
+            :return_tail (bool) - also return the last n-1 cleaned characters of the stream
+        returns:
+            :(numpy.ndarray of int64) - flat array of size `len(alphabet)**n` of n-gram counts
+            :(str) - if return_tail enabled, the last n-1 cleaned characters of the stream
+        """
+        counts = np.zeros(self.base ** self.n, dtype=np.int64)
+        _, tail = self._count(chunks, filt, counts)
+        return (counts, tail) if return_tail else counts
+
+    def _count(self, chunks, filt, counts):
+        """
+        internal method of `count` and `count_shards`; adds the n-grams of each chunk
+        into `counts` as it goes, so memory stays constant in the length of the stream
+        returns:
+            :(str) - the first n-1 cleaned characters of the stream
+            :(str) - the last n-1 cleaned characters of the stream
+        """
+        filt = re.compile(filt)
+        head, carry = "", ""
+        for chunk in chunks:
+            cleaned = filt.sub("", chunk).lower()
+            if len(head) < self.n - 1:
+                head = (head + cleaned)[:self.n - 1]
+            text = carry + cleaned
+            grams, grams_counts = np.unique(self.codes(self.encode(text)), return_counts=True)
+            counts[grams] += grams_counts
+            carry = text[max(0, len(text) - self.n + 1):]
+        return head, carry
+
+    @classmethod
+    def from_shards(cls, shards, n, filt=FILTER, alphabet=string.ascii_lowercase, workers=None, size=BUFFER_SIZE):
+        """
+        build a dense table by counting shards of a training corpus across a pool of
+        processes. The shards are merged in order, counting the n-grams that span
+        the boundary between consecutive shards, so the table is identical to that of
+        `from_corpus` on the concatenated shards
+
+        args:
+            :shards (list of (str, int, int or NoneType)) - (filename, start, end) byte ranges of
+                                                              the corpus in order, e.g. from `corpus_shards`
+            :n (int > 0) - the length of the n-grams
+            :filt (str, regex) - the characters to remove, as in .utils.clean
+            :alphabet (str, optional) - the alphabet the n-grams are drawn from
+            :workers (int > 0, optional) - number of processes, defaults to os.cpu_count()
+            :size (int > 0, optional) - the number of bytes read at a time
+        returns:
+            :(NGramTable) - the dense table
+        """
+        require_numpy()
+        table = cls(np.empty(len(alphabet) ** n, dtype=np.float32), n, 0.0, alphabet=alphabet)
+        table.set_counts(table.count_shards(shards, filt=filt, workers=workers, size=size))
+        return table
+
+    def count_shards(self, shards, filt=FILTER, workers=None, size=BUFFER_SIZE, return_tail=False):
+        """
+        count the n-grams of shards of a training corpus across a pool of processes,
+        as `count` would count the concatenated shards
+
+        args:
+            :shards (list of (str, int, int or NoneType)) - (filename, start, end) byte ranges of
+                                                              the corpus in order, e.g. from `corpus_shards`
+            :filt (str, regex) - the characters to remove, as in .utils.clean
+            :workers (int > 0, optional) - number of processes, defaults to os.cpu_count()
+            :size (int > 0, optional) - the number of bytes read at a time
+            :return_tail (bool) - also return the last n-1 cleaned characters of the corpus
+        returns:
+            :(numpy.ndarray of int64) - flat array of size `len(alphabet)**n` of n-gram counts
+            :(str) - if return_tail enabled, the last n-1 cleaned characters of the corpus
+        """
+        from .solve import _pool # imported here, as .solve imports this module
+        tasks = [(filename, start, end, self.n, filt, self.alphabet, size) for filename, start, end in shards]
+
+        counts = np.zeros(self.base ** self.n, dtype=np.int64)
+        carry = ""
+        with _pool(workers or os.cpu_count() or 1) as pool:
+            # merged as each shard arrives, in order, rather than holding every shard's counts
+            for grams, grams_counts, head, tail in pool.imap(_count_shard, tasks):
+                counts[grams] += grams_counts
+                # the n-grams starting in the previous shards' carry and ending in this one
+                spanning = self.codes(self.encode(carry + head))[:len(carry)]
+                np.add.at(counts, spanning, 1)
+                joint = carry + tail
+                carry = joint[max(0, len(joint) - self.n + 1):]
+        return (counts, carry) if return_tail else counts
+
+    def set_counts(self, counts):
+        """
+        fill the table in place with the log probabilities of some n-gram counts
+        args:
+            :counts (numpy.ndarray) - flat integer array of size `len(alphabet)**n` of n-gram counts
+        raises:
+            :ValueError if there are no n-grams at all
+        """
+        self.logprobs[:], self.floor = ConstantFloor()([counts])
+        self.total = int(counts.sum())
+        self.seen = np.packbits(counts > 0)
+
+    def encode(self, text):
+        """
+        encode a text as an array of alphabet indices
+        args:
+            :text (str) - the text to encode, consisting only of `alphabet` characters
+        returns:
+            :(numpy.ndarray of uint8) - the index of each character in `alphabet`
+        raises:
+            :ValueError if `text` contains characters outside of `alphabet`
+        """
+        encoded = self._lookup[np.frombuffer(text.encode("latin-1", "replace"), dtype=np.uint8)]
+        if (encoded == self.base).any():
+            raise ValueError("Expected text to consist only of alphabet characters")
+        return encoded
+
+    def codes(self, encoded):
+        """
+        compute the table index of every n-gram of an encoded text
+        args:
+            :encoded (numpy.ndarray) - output of `encode`
+        returns:
+            :(numpy.ndarray of int64) - one code per n-gram, `len(encoded) - n + 1` in total
+        """
+        count = len(encoded) - self.n + 1
+        if count <= 0:
+            return np.zeros(0, dtype=np.int64)
+        codes = np.zeros(count, dtype=np.int64)
+        for d, place in enumerate(self._place):
+            codes += encoded[d:d+count] * place
+        return codes
+
+    def score(self, text):
+        """
+        Score a text based on its n-gram language model log likelihood
+
+        args:
+            :text (str) - the text to score, consisting only of `alphabet` characters
+        returns:
+            :(float) - the n-gram lang. model log likelihood
+        """
+        return float(self.logprobs[self.codes(self.encode(text))].sum(dtype=np.float64))
+
+    def unseen(self, text):
+        """
+        count the n-grams of a text that never occurred in the training corpus
+        args:
+            :text (str) - the text to check, consisting only of `alphabet` characters
+        returns:
+            :(int) - the number of its unseen n-grams, with repetition
+        """
+        codes = self.codes(self.encode(text))
+        if self.seen is None: # e.g. a version 1 file; only the floor marks unseen n-grams
+            return int((self.logprobs[codes] <= self.floor).sum())
+        return int(len(codes) - ((self.seen[codes >> 3] >> (7 - (codes & 7))) & 1).sum())
+
+    def logprob(self, gram):
+        """
+        Look up the log probability of a single n-gram
+        args:
+            :gram (str) - an n-gram of `alphabet` characters
+        returns:
+            :(float) - its log probability, `floor` if it was never seen
+        """
+        return float(self.logprobs[self.codes(self.encode(gram))[0]])
+
+    def marginal(self, width):
+        """
+        estimate the probabilities of shorter grams by marginalizing the table
+        over its trailing characters
+        args:
+            :width (int, 0 < width <= n) - the length of the grams to estimate
+        returns:
+            :(dict) - mapping from `width`-grams --> their (unnormalized) probabilities
+        """
+        assert 0 < width <= self.n, "Bad width; cannot marginalize to longer grams"
+        probs = np.exp2(self.logprobs.astype(np.float64)).reshape(self.base ** width, -1).sum(axis=1)
+        return {self.decode(code, width): float(p) for code, p in enumerate(probs)}
+
+    def decode(self, code, width=None):
+        """
+        args:
+            :code (int) - the code of a gram
+            :width (int, optional) - the length of the gram, defaults to n
+        returns:
+            :(str) - the gram
+        """
+        width = self.n if width is None else width
+        gram = []
+        for _ in range(width):
+            code, digit = divmod(code, self.base)
+            gram.append(self.alphabet[digit])
+        return "".join(reversed(gram))
+
+    def save(self, filename):
+        """
+        atomically write the table to `filename` in the binary model format,
+        which `load` can memory map without parsing
+        args:
+            :filename (str) - the path of the model file
+        """
+        with atomic_write(filename) as f:
+            self._write(f)
+
+    def _write(self, f):
+        """
+        internal method of `save` and NGramModel.save; writes the table to an open binary file
+        """
+        alphabet = self.alphabet.encode("ascii")
+        flags = FLAG_SEEN if self.seen is not None else 0
+        f.write(HEADER.pack(MAGIC, VERSION, self.n, len(alphabet), flags, self.total or 0, self.floor))
+        f.write(alphabet.ljust(-(-len(alphabet) // 8) * 8, b"\0"))
+        f.write(np.ascontiguousarray(self.logprobs, dtype="<f4").tobytes())
+        if self.seen is not None:
+            f.write(np.ascontiguousarray(self.seen, dtype=np.uint8).tobytes())
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """
+        open a table written by `save`, or the lowest order table written by NGramModel.save;
+        by default the body is memory mapped read-only, so opening is near-instant and the
+        pages are shared by every process using it
+
+        args:
+            :filename (str) - the path of the model file
+            :mmap (bool) - memory map the body rather than reading it into memory
+        returns:
+            :(NGramTable) - the table
+        raises:
+            :ImportError if numpy is not installed
+            :FileNotFoundError if there is no such file
+            :ValueError if the file is not a model file of a supported version
+        """
+        require_numpy()
+        return cls._read(filename, 0, mmap)[0]
+
+    @classmethod
+    def _read(cls, filename, offset, mmap):
+        """
+        internal method of `load` and NGramModel.load; opens the table starting at byte `offset`
+        returns:
+            :(NGramTable) - the table
+            :(int) - the offset of the byte following the table
+        """
+        with open(filename, "rb") as f:
+            f.seek(offset)
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{filename} is not an n-gram model file")
+            magic, version, n, length, flags, total, floor = HEADER.unpack(header)
+            if version not in VERSIONS:
+                raise ValueError(f"Unsupported n-gram model version {version} in {filename}")
+            alphabet = f.read(length).decode("ascii")
+
+        offset += HEADER.size + -(-length // 8) * 8
+
+        def body(dtype, count, offset):
+            if mmap:
+                return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(count,))
+            return np.fromfile(filename, dtype=dtype, offset=offset, count=count)
+
+        logprobs = body("<f4", length ** n, offset)
+        offset += 4 * length ** n
+        seen = None
+        if flags & FLAG_SEEN:
+            seen = body(np.uint8, -(-length ** n // 8), offset)
+            offset += len(seen)
+        table = cls(logprobs, n, floor, alphabet=alphabet, total=total or None, seen=seen)
+        return table, offset
+
+
+#### smoothing ####
+class Smoothing(object):
+    """
+    Smoothing is the base class for the ways NGramModel estimates the probabilities
+    of n-grams from their counts, in particular of those never seen in the corpus
+
+    Every smoothing is called with the counts of every order 1..k and returns the
+    dense joint log probabilities of the k-grams. The tables are computed once and
+    are read-only thereafter, so scoring never mutates the model.
+    """
+
+    def __call__(self, counts):
+        """
+        args:
+            :counts (list of numpy.ndarray) - flat k-gram count arrays of the orders 1..k, in order
+        returns:
+            :(numpy.ndarray of float32) - flat array of k-gram log probabilities
+            :(float) - the log probability of the least likely k-gram
+        raises:
+            :ValueError if there are no k-grams at all
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def total(counts):
+        """
+        returns:
+            :(int) - the total number of n-grams counted in `counts`
+        raises:
+            :ValueError if there are none
+        """
+        total = int(counts.sum())
+        if total == 0:
+            raise ValueError("Expected at least one n-gram to build a table from")
+        return total
+
+    def __str__(self):
+        return f"{self.__class__.__name__}()"
+
+class ConstantFloor(Smoothing):
+    """
+    Maximum likelihood estimates of the seen n-grams; every unseen n-gram scores
+    the same floor of log2(0.0001/total n-grams). Only the highest order is used
+    """
+
+    def __call__(self, counts):
+        counts = counts[-1]
+        total = self.total(counts)
+        floor = log2(0.0001/total)
+
+        seen = counts > 0
+        logprobs = np.full(len(counts), floor, dtype=np.float32)
+        logprobs[seen] = np.log2(counts[seen] / total)
+        return logprobs, floor
+
+class AddK(Smoothing):
+    """
+    Additive smoothing; every n-gram is counted `k` more times than it was seen,
+    so unseen n-grams score log2(k/(total + k*`len(alphabet)**n`))
+    """
+
+    def __init__(self, k=0.01):
+        """
+        args:
+            :k (float > 0) - the pseudo-count added to every n-gram
+        """
+        self.k = k
+
+    def __call__(self, counts):
+        counts = counts[-1]
+        norm = self.total(counts) + self.k * len(counts)
+        logprobs = np.log2((counts + self.k) / norm).astype(np.float32)
+        return logprobs, log2(self.k / norm)
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(k={self.k})"
+
+class KneserNey(Smoothing):
+    """
+    Interpolated Kneser-Ney smoothing
+
+    The probability of a character given its history discounts every seen count
+    by `discount` and gives the discounted mass to the next lower order, whose
+    counts are continuation counts: the number of distinct characters preceding
+    a gram rather than its frequency. Unigrams are interpolated with the uniform
+    distribution, so no n-gram is impossible. The joint probability of an n-gram
+    is the product of the conditional probabilities of its characters given
+    their predecessors, e.g. p(abcd) = p(a)p(b|a)p(c|ab)p(d|abc), each estimated
+    with its own order as the highest.
+    """
+
+    def __init__(self, discount=0.75):
+        """
+        args:
+            :discount (float, 0 < discount < 1) - the absolute discount of seen counts
+        """
+        self.discount = discount
+
+    def __call__(self, counts):
+        self.total(counts[-1])
+        joint = self.conditional(counts[:1]).ravel()
+        for k in range(2, len(counts) + 1):
+            joint = (joint[:, None] * self.conditional(counts[:k])).ravel()
+        logprobs = np.log2(joint).astype(np.float32)
+        return logprobs, float(logprobs.min())
+
+    def conditional(self, counts):
+        """
+        args:
+            :counts (list of numpy.ndarray) - flat k-gram count arrays of the orders 1..k, in order
+        returns:
+            :(numpy.ndarray of float64) - (`len(alphabet)**(k-1)`, `len(alphabet)`) array of the
+                                          probabilities of each character given each history
+        """
+        k, base = len(counts), len(counts[0])
+
+        # conditional distributions of each order, as (histories, base) arrays
+        # of the highest order's counts and the lower orders' continuation counts
+        conditionals = []
+        for order in range(1, k + 1):
+            if order == k:
+                seen = counts[order - 1].astype(np.float64)
+            else:
+                seen = (counts[order] > 0).reshape(base, -1).sum(axis=0).astype(np.float64)
+            seen = seen.reshape(-1, base)
+            if order == 1:
+                lower = np.full((1, base), 1 / base)
+            else:
+                lower = conditionals[-1][np.arange(len(seen)) % len(conditionals[-1])]
+
+            context = seen.sum(axis=1, keepdims=True)
+            types = (seen > 0).sum(axis=1, keepdims=True)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                smoothed = (np.maximum(seen - self.discount, 0) + self.discount * types * lower) / context
+            conditionals.append(np.where(context > 0, smoothed, lower))
+        return conditionals[-1]
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(discount={self.discount})"
+
+
+# command line names of the smoothings
+SMOOTHINGS = {"floor": ConstantFloor, "add-k": AddK, "kneser-ney": KneserNey}
+
+
+class NGramModel(object):
+    """
+    Dense n-gram tables of every order 1..n over the same alphabet
+
+    All orders are built from a single pass over the training corpus: only the
+    n-grams are counted, and the counts of every lower order k follow exactly by
+    summing the (k+1)-gram counts over their last character, plus one for the
+    final k-gram of the corpus, which starts no (k+1)-gram.
+
+    Index the model by order for the table to score with, e.g. to climb with
+    bigrams before finishing with the full order:
+
+    >>> model = NGramModel.from_corpus("corpus.txt", 4)
+    >>> coarse = SubstitutionSolver.from_table(model[2])
+    >>> fine = SubstitutionSolver.from_table(model[model.n])
+    """
+
+    def __init__(self, tables):
+        """
+        args:
+            :tables (iterable of NGramTable) - tables of distinct orders over the same alphabet
+        raises:
+            :ValueError if there are no tables, or they repeat an order or differ in alphabet
+        """
+        tables = list(tables)
+        self.tables = {table.n: table for table in tables}
+        if not tables:
+            raise ValueError("Expected at least one n-gram table")
+        if len(self.tables) != len(tables):
+            raise ValueError("Expected n-gram tables of distinct orders")
+        if len({table.alphabet for table in tables}) > 1:
+            raise ValueError("Expected n-gram tables over the same alphabet")
+
+        self.orders = sorted(self.tables)
+        self.n = self.orders[-1]
+        self.alphabet = tables[0].alphabet
+
+    def __getitem__(self, order):
+        return self.tables[order]
+
+    def __contains__(self, order):
+        return order in self.tables
+
+    def __iter__(self):
+        """
+        yields:
+            :(NGramTable) the tables, from the lowest order up
+        """
+        for order in self.orders:
+            yield self.tables[order]
+
+    @classmethod
+    def from_counts(cls, counts, tail, n, alphabet=string.ascii_lowercase, smoothing=None):
+        """
+        build the tables of every order 1..n from n-gram counts, e.g. the output of
+        NGramTable.count with `return_tail` enabled
+
+        args:
+            :counts (numpy.ndarray) - flat integer array of size `len(alphabet)**n` of n-gram counts
+            :tail (str) - the last n-1 (or fewer, in a shorter corpus) characters of the counted text
+            :n (int > 0) - the highest order
+            :alphabet (str, optional) - the alphabet the n-grams are drawn from
+            :smoothing (Smoothing, optional) - how to estimate the probabilities, defaults to ConstantFloor()
+        returns:
+            :(NGramModel) - the model; its tables are read-only
+        """
+        require_numpy()
+        base, orders = len(alphabet), [counts]
+        for k in range(n - 1, 0, -1):
+            counts = counts.reshape(base ** k, base).sum(axis=1)
+            if len(tail) >= k: # the last k-gram, which no (k+1)-gram starts with
+                table = NGramTable(np.empty(base ** k, dtype=np.float32), k, 0.0, alphabet=alphabet)
+                counts[table.codes(table.encode(tail[len(tail) - k:]))[0]] += 1
+            orders.insert(0, counts)
+
+        smoothing = ConstantFloor() if smoothing is None else smoothing
+        tables = []
+        for k in range(1, n + 1):
+            logprobs, floor = smoothing(orders[:k])
+            logprobs.flags.writeable = False
+            tables.append(NGramTable(logprobs, k, floor, alphabet=alphabet, total=int(orders[k - 1].sum()),
+                                     seen=np.packbits(orders[k - 1] > 0)))
+        return cls(tables)
+
+    @classmethod
+    def from_corpus(cls, filename, n, filt=FILTER, alphabet=string.ascii_lowercase, size=BUFFER_SIZE,
+                    smoothing=None):
+        """
+        build the tables of every order 1..n by streaming a training corpus once;
+        unsmoothed, each table is identical to that of NGramTable.from_corpus of its order
+
+        args:
+            :filename, filt, alphabet, size - see NGramTable.from_corpus
+            :n (int > 0) - the highest order
+            :smoothing (Smoothing, optional) - how to estimate the probabilities, defaults to ConstantFloor()
+        returns:
+            :(NGramModel) - the model
+        """
+        require_numpy()
+        table = NGramTable(np.empty(len(alphabet) ** n, dtype=np.float32), n, 0.0, alphabet=alphabet)
+        counts, tail = table.count(read_chunks(filename, size), filt=filt, return_tail=True)
+        return cls.from_counts(counts, tail, n, alphabet=alphabet, smoothing=smoothing)
+
+    @classmethod
+    def from_shards(cls, shards, n, filt=FILTER, alphabet=string.ascii_lowercase, workers=None, size=BUFFER_SIZE,
+                    smoothing=None):
+        """
+        build the tables of every order 1..n by counting shards of a training corpus
+        across a pool of processes, once
+
+        args:
+            :shards, filt, alphabet, workers, size - see NGramTable.from_shards
+            :n (int > 0) - the highest order
+            :smoothing (Smoothing, optional) - how to estimate the probabilities, defaults to ConstantFloor()
+        returns:
+            :(NGramModel) - the model
+        """
+        require_numpy()
+        table = NGramTable(np.empty(len(alphabet) ** n, dtype=np.float32), n, 0.0, alphabet=alphabet)
+        counts, tail = table.count_shards(shards, filt=filt, workers=workers, size=size, return_tail=True)
+        return cls.from_counts(counts, tail, n, alphabet=alphabet, smoothing=smoothing)
+
+    def save(self, filename):
+        """
+        atomically write every table to `filename`, one after the other from the
+        lowest order up, each in the binary model format of NGramTable.save
+        args:
+            :filename (str) - the path of the model file
+        """
+        with atomic_write(filename) as f:
+            for table in self:
+                table._write(f)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """
+        open the tables written by `save`, memory mapped read-only by default
+
+        args:
+            :filename (str) - the path of the model file
+            :mmap (bool) - memory map the tables rather than reading them into memory
+        returns:
+            :(NGramModel) - the model
+        raises:
+            :ImportError if numpy is not installed
+            :FileNotFoundError if there is no such file
+            :ValueError if the file is not a model file of a supported version
+        """
+        require_numpy()
+        size, offset, tables = os.path.getsize(filename), 0, []
+        while offset < size:
+            table, offset = NGramTable._read(filename, offset, mmap)
+            tables.append(table)
+        return cls(tables)
+
+
+def _count_shard(task):
+    """
+    process pool worker of NGramTable.from_shards; counts one byte range of a corpus
+    returns:
+        :(numpy.ndarray, numpy.ndarray) - sparse (codes, counts) of the n-grams within the shard
+        :(str, str) - the first and last n-1 cleaned characters of the shard
+    """
+    filename, start, end, n, filt, alphabet, size = task
+    table = NGramTable(np.empty(len(alphabet) ** n, dtype=np.float32), n, 0.0, alphabet=alphabet)
+    counts = np.zeros(table.base ** n, dtype=np.int64)
+    head, tail = table._count(read_range(filename, start, end, size=size), filt, counts)
+    grams = np.flatnonzero(counts)
+    return grams, counts[grams], head, tail
+
+def corpus_shards(path, count):
+    """
+    split a training corpus into byte-range shards for NGramTable.from_shards; a
+    directory is sharded by file, a single file into `count` ranges of about equal
+    size whose boundaries never cut a UTF-8 character
+
+    args:
+        :path (str) - preverified path to the corpus file or directory
+        :count (int > 0) - the number of shards to split a single file into
+    returns:
+        :(list of (str, int, int or NoneType)) - (filename, start, end) byte ranges in corpus order
+    """
+    if os.path.isdir(path):
+        return [(filename, 0, None) for filename in corpus_files(path)]
+
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, count):
+            offset = max(bounds[-1], size * i // count)
+            f.seek(offset)
+            while (f.read(1) or b"\0")[0] & 0xC0 == 0x80: # continuation byte of a UTF-8 character
+                offset += 1
+            bounds.append(offset)
+    bounds.append(size)
+    return [(path, start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
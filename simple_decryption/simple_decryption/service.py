@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Daniel Berenberg
+"""
+simple_decryption service library. Serves solve and decrypt requests against a
+warm solver over HTTP, on a local TCP port or a Unix socket.
+
+The endpoints take and return JSON:
+    GET  /health  - {"status": "ok", ...}
+    POST /solve   - {"ciphertext": str, "iterations"?: int, "max_attempts"?: int, "start"?: str}
+                    --> {"key": str, "fitness": float, "attempts": int, "accepted": bool,
+                         "plaintext": str, "seconds": float}
+    POST /decrypt - {"ciphertext": str, "key": str} --> {"plaintext": str}
+"""
+import os
+import json
+import time
+import signal
+import asyncio
+from .core import SubstitutionCipher
+from .solve import _pool, _message_worker
+
+__all__ = ["SolverService"]
+
+MAX_BODY = 1 << 24 # the largest request body accepted, in bytes
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+class RequestError(Exception):
+    """
+    A request the service cannot serve; carries the HTTP status to respond with
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class SolverService(object):
+    """
+    Long-running service that keeps a solver and its n-gram model loaded
+
+    An asyncio front end parses requests and dispatches solves to a pool of
+    processes; where the platform supports it, the workers are forked so the
+    model is shared copy-on-write rather than loaded per request. Decrypting
+    with a known key is cheap and served directly by the front end.
+    """
+
+    def __init__(self, solver, accept=None, workers=None, n_iters=5000, max_attempts=10,
+                 start="unigram", **options):
+        """
+        args:
+            :solver (.solve.SubstitutionSolver or .solve.StagedSubstitutionSolver) - the warm solver
+            :accept (callable, optional) - takes the vocabulary of a message and a SubstitutionCipher
+                                           and returns True if it solves the message, see
+                                           .solve.solve_message; must be picklable where processes
+                                           cannot be forked
+            :workers (int > 0, optional) - number of processes, defaults to os.cpu_count()
+            :n_iters, max_attempts, start - defaults of the solve requests, see .solve.solve_message
+            :**options - keyword arguments passed on to the solver's `solve`, e.g. strategy=
+        """
+        self.solver = solver
+        self.accept = accept
+        self.workers = workers or os.cpu_count() or 1
+        self.n_iters = n_iters
+        self.max_attempts = max_attempts
+        self.start = start
+        self.options = options
+        self.executor = None
+
+    def open(self):
+        """
+        start the worker processes
+        """
+        self.executor = _pool(self.workers, (self.solver, self.accept, self.options), executor=True)
+
+    def close(self):
+        """
+        stop the worker processes, cancelling pending solves and waiting on running ones
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    async def solve(self, ciphertext, n_iters=None, max_attempts=None, start=None):
+        """
+        solve a message in the worker pool
+        args:
+            :ciphertext (str) - the raw encrypted message
+            :n_iters, max_attempts, start (optional) - override the service defaults
+        returns:
+            :(dict) - the key, fitness, attempts, whether the key was accepted, the
+                      plaintext and the seconds spent
+        """
+        if self.executor is None:
+            self.open()
+        then = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        key, fitness, attempts, accepted = await loop.run_in_executor(
+            self.executor, _message_worker, ciphertext, n_iters or self.n_iters,
+            max_attempts or self.max_attempts, start or self.start)
+        return {"key": key, "fitness": fitness, "attempts": attempts, "accepted": accepted,
+                "plaintext": SubstitutionCipher(key).decrypt(ciphertext, preserve_case=True),
+                "seconds": time.perf_counter() - then}
+
+    def decrypt(self, ciphertext, key):
+        """
+        args:
+            :ciphertext (str) - the raw encrypted message
+            :key (str) - the decryption key
+        returns:
+            :(dict) - the plaintext
+        """
+        return {"plaintext": SubstitutionCipher(key).decrypt(ciphertext, preserve_case=True)}
+
+    async def route(self, method, path, body):
+        """
+        serve one request
+        args:
+            :method (str) - the HTTP method
+            :path (str) - the request path
+            :body (bytes) - the request body
+        returns:
+            :(dict) - the response
+        raises:
+            :RequestError for unknown endpoints and malformed requests
+        """
+        if (method, path) == ("GET", "/health"):
+            return {"status": "ok", "n": self.solver.gram_len, "workers": self.workers}
+        if method != "POST" or path not in ("/solve", "/decrypt"):
+            raise RequestError(404, f"No endpoint {method} {path}")
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError as e:
+            raise RequestError(400, f"Expected a JSON body: {e}")
+        if not isinstance(request, dict) or not isinstance(request.get("ciphertext"), str):
+            raise RequestError(400, "Expected a JSON object with a \"ciphertext\" string")
+
+        if path == "/decrypt":
+            if not isinstance(request.get("key"), str):
+                raise RequestError(400, "Expected a \"key\" string")
+            try:
+                return self.decrypt(request["ciphertext"], request["key"])
+            except AssertionError as e:
+                raise RequestError(400, f"Bad key: {e}")
+
+        for name in ("iterations", "max_attempts"):
+            if not isinstance(request.get(name, 1), int) or request.get(name, 1) <= 0:
+                raise RequestError(400, f"Expected \"{name}\" to be an integer > 0")
+        if request.get("start", "unigram") not in ("random", "unigram", "bigram"):
+            raise RequestError(400, "Expected \"start\" to be one of random, unigram, bigram")
+        return await self.solve(request["ciphertext"], n_iters=request.get("iterations"),
+                                max_attempts=request.get("max_attempts"), start=request.get("start"))
+
+    async def handle(self, reader, writer):
+        """
+        asyncio stream handler; reads one HTTP/1.1 request and writes its JSON response
+        """
+        try:
+            try:
+                method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                raise RequestError(400, "Malformed HTTP request")
+            if length > MAX_BODY:
+                raise RequestError(413, f"Expected a body of at most {MAX_BODY} bytes")
+            status, response = 200, await self.route(method, path.split("?")[0], await reader.readexactly(length))
+        except RequestError as e:
+            status, response = e.status, {"error": str(e)}
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+        except Exception as e: # keep serving after a failed solve
+            status, response = 500, {"error": f"{e.__class__.__name__}: {e}"}
+
+        payload = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host="127.0.0.1", port=8000):
+        """
+        serve requests until cancelled, or the process receives SIGINT or SIGTERM
+        args:
+            :path (str, optional) - the path of a Unix socket to listen on, instead of TCP
+            :host (str) - the TCP host to listen on
+            :port (int) - the TCP port to listen on
+        """
+        self.open()
+        loop, task = asyncio.get_running_loop(), asyncio.current_task()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, task.cancel)
+            except (NotImplementedError, RuntimeError): # e.g. on Windows
+                pass
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self.handle, path=path)
+            else:
+                server = await asyncio.start_server(self.handle, host=host, port=port)
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.close()
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
@@ -1,15 +1,30 @@
+import os
+import time
 import random
 import string
+import asyncio
+import functools
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
 from math import log2
-from .utils import chunks
+from collections import Counter, defaultdict
+from .utils import chunks, clean_text
 from .core import SubstitutionCipher
+from . import model
+from .strategy import HillClimbing
 
 """
 solve submodule intended for cipher-specific solution codes
 """
-__all__ = ["SubstitutionSolver"]
+__all__ = ["SubstitutionSolver", "StagedSubstitutionSolver", "PatternSubstitutionSolver", "ParallelSubstitutionSolver",
+           "BatchSubstitutionSolver", "SolveStats", "SolveProgress", "DeltaScorer", "CountScorer",
+           "solve_message", "solve_async"]
 
 CLEAR = 80 * " "
+SWAPS = list(itertools.combinations(range(26), 2)) # every distinct swap of a key
+NEIGHBORHOOD = len(SWAPS)
 
 class SubstitutionSolver(object):
     """
@@ -20,17 +35,69 @@ class SubstitutionSolver(object):
     has expired
     """
 
-    def __init__(self, ngram_distribution, total_ngrams, gram_length):
+    def __init__(self, ngram_distribution, total_ngrams, gram_length, table=None, log=True):
         """ 
         args:
-            :ngram_distribution (dict) - mapping from ngrams -> their (log) probabilities
+            :ngram_distribution (dict or NoneType) - mapping from ngrams -> their (log) probabilities;
+                                                     may be None if `table` is given
             :total_ngrams (int) - the total number of ngrams found in the corpus text
             :gram_length (int) - the length of the ngrams in `ngram_distribution`
-            :vocab (optional) - vocabulary to verify the solution against; casted to set on construction
+            :table (.model.NGramTable, optional) - dense version of `ngram_distribution` used
+                                                  for vectorized scoring of whole texts
+            :log (bool) - whether `ngram_distribution` holds log2 probabilities, as
+                          .utils.ngram_distribution(..., log=True) returns, or plain ones
         """
         self.ngram_dist = ngram_distribution
         self.N = total_ngrams
         self.gram_len = gram_length
+        self.table = table
+        self.log = log
+        # the log probability of unseen n-grams
+        self.floor = table.floor if table is not None else log2(0.0001/total_ngrams)
+        self.stop_reason = None # why the last call to `solve` stopped
+        self.iterations = 0     # how many iterations the last call to `solve` ran
+        self.stats = None       # SolveStats of the last call to `solve`
+        self._marginals = {}    # width --> memoized `marginal`
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        build a solver backed only by a dense table, e.g. one memory mapped by
+        .model.NGramTable.load, without materializing the n-gram dictionary
+        args:
+            :table (.model.NGramTable) - the dense language model
+        returns:
+            :(SubstitutionSolver) - the solver
+        """
+        return cls(None, table.total, table.n, table=table)
+
+    def logprob(self, gram):
+        """
+        Look up the (log) probability of a single n-gram
+
+        args:
+            :gram (str) - an n-gram of length `self.gram_len`
+        returns:
+            :(float) - the n-gram (log) probability, `self.floor` if it did not occur in the training corpus
+        """
+        if self.ngram_dist is None:
+            return self.table.logprob(gram)
+        # misses fall back to the floor rather than being added, so the distribution is never
+        # modified; `solve` still records per-search state, so a solver runs one search at a
+        # time and parallel searches each use their own copy, e.g. one per worker process
+        return self.ngram_dist.get(gram, self.floor)
+
+    def unseen(self, string):
+        """
+        count the n-grams of a string unseen in the training corpus
+        args:
+            :string (str) - the string to check
+        returns:
+            :(int) - the number of its unseen n-grams, with repetition
+        """
+        if self.ngram_dist is None:
+            return self.table.unseen(string)
+        return sum(chunk not in self.ngram_dist for chunk in chunks(string, self.gram_len))
 
     def score(self, string):
         """
@@ -48,18 +115,21 @@ class SubstitutionSolver(object):
         if not isinstance(string, str):
             raise TypeError("Expected `string` to be str")
         
-        total = 0
-        for chunk in chunks(string, self.gram_len):
-            try:
-                p = self.ngram_dist[chunk]
-            except KeyError:
-                # this chunk did not occur in the training corpus,
-                # add it for future use with a low probability
-                self.ngram_dist[chunk] = log2(0.0001/self.N)
-                p = self.ngram_dist[chunk]
-            
-            total += p
-        return total
+        if self.table is not None:
+            return self.table.score(string)
+        return sum(self.logprob(chunk) for chunk in chunks(string, self.gram_len))
+
+    @staticmethod
+    def random_swap():
+        """
+        pick two distinct key positions to swap
+        returns:
+            :(int, int) - the key positions
+        """
+        swp1 = swp2 = 0
+        while swp1 == swp2:
+            swp1, swp2 = random.randint(0, 25), random.randint(0, 25)
+        return swp1, swp2
 
     @staticmethod
     def mutate(parent):
@@ -71,9 +141,7 @@ class SubstitutionSolver(object):
             :(str) - the mutated parent, a child
         """
         child = list(parent)
-        swp1 = swp2 = 0
-        while swp1 == swp2:
-            swp1, swp2 = random.randint(0, 25), random.randint(0, 25)      
+        swp1, swp2 = SubstitutionSolver.random_swap()
         child[swp1], child[swp2] = child[swp2], child[swp1]
         
         return "".join(child)
@@ -89,46 +157,1177 @@ class SubstitutionSolver(object):
         random.shuffle(key)
         return "".join(key)
 
-    def solve(self, ciphertext, n_iters, verbose=False, seed_parent=None):
+    def marginal(self, width):
+        """
+        estimate the probabilities of shorter grams by marginalizing the n-gram
+        distribution over its trailing characters
+        args:
+            :width (int, 0 < width <= gram_length) - the length of the grams to estimate
+        returns:
+            :(dict) - mapping from `width`-grams --> their (unnormalized) probabilities
+        """
+        assert 0 < width <= self.gram_len, "Bad width; cannot marginalize to longer grams"
+        if width in self._marginals: # the model is never modified, so neither is its marginal
+            return self._marginals[width]
+        if self.ngram_dist is None:
+            marginal = self.table.marginal(width)
+        else:
+            marginal = {}
+            for gram, p in self.ngram_dist.items():
+                if self.log:
+                    p = 2 ** p
+                marginal[gram[:width]] = marginal.get(gram[:width], 0) + p
+        self._marginals[width] = marginal
+        return marginal
+
+    def frequency_parent(self, ciphertext, bigrams=False, alphabet=string.ascii_lowercase):
+        """
+        generate a parent key by frequency analysis; the i-th most frequent ciphertext
+        letter decrypts to the i-th most frequent letter of the training corpus. With
+        `bigrams`, the key is then refined by greedy swaps that improve the bigram
+        log likelihood of the decrypted text
+
+        args:
+            :ciphertext (str) - the encrypted text
+            :bigrams (bool) - refine the key with bigram statistics, when gram_length > 1
+            :alphabet (str, optional) - the ciphertext alphabet
+        returns:
+            :(str) - a parent cipher key
+        """
+        text_counts = Counter(ch for ch in ciphertext if ch in alphabet)
+        corpus_probs = self.marginal(1)
+
+        by_text = sorted(alphabet, key=lambda ch: -text_counts[ch])
+        by_corpus = sorted(alphabet, key=lambda ch: -corpus_probs.get(ch, 0))
+        plain = dict(zip(by_text, by_corpus))
+        key = [plain[ch] for ch in alphabet]
+
+        if bigrams and self.gram_len > 1:
+            key = self._refine_bigrams(ciphertext, key, alphabet)
+        return "".join(key)
+
+    def _refine_bigrams(self, ciphertext, key, alphabet):
         """
-        perform the hill climber algorithm on cipher text for some number of iterations
+        greedily swap key positions while the bigram log likelihood improves
         args:
             :ciphertext (str) - the encrypted text
-            :n_iters (int) - number of iterations to run
+            :key (list of str) - the decryption key to refine
+            :alphabet (str) - the ciphertext alphabet
+        returns:
+            :(list of str) - the refined key
+        """
+        index = {ch: p for p, ch in enumerate(alphabet)}
+        size = len(alphabet)
+
+        # counts[a][b] is the number of cipher bigrams (alphabet[a], alphabet[b])
+        counts = [[0] * size for _ in alphabet]
+        for gram in chunks(ciphertext, 2):
+            if gram[0] in index and gram[1] in index:
+                counts[index[gram[0]]][index[gram[1]]] += 1
+
+        marginal = self.marginal(2)
+        floor = self.floor
+        logprobs = {gram: log2(p) if p > 0 else floor for gram, p in marginal.items()}
+        logprob = lambda x, y: logprobs.get(key[x] + key[y], floor)
+
+        def touching(a, b):
+            # log likelihood of every cipher bigram containing position a or b
+            rows = sum(counts[x][y] * logprob(x, y) for x in (a, b) for y in range(size) if counts[x][y])
+            cols = sum(counts[x][y] * logprob(x, y) for y in (a, b) for x in range(size)
+                       if x not in (a, b) and counts[x][y])
+            return rows + cols
+
+        improved = True
+        while improved:
+            improved = False
+            for a, b in itertools.combinations(range(size), 2):
+                before = touching(a, b)
+                key[a], key[b] = key[b], key[a]
+                if touching(a, b) > before:
+                    improved = True
+                else:
+                    key[a], key[b] = key[b], key[a]
+        return key
+
+    def scorer(self, ciphertext, key):
+        """
+        build the incremental scorer used by `solve`; ciphertext-space counts
+        against the dense table if one was given, otherwise per-window rescoring
+        args:
+            :ciphertext (str) - the encrypted text
+            :key (str) - the initial decryption key
+        returns:
+            :(DeltaScorer or CountScorer) - the scorer
+        """
+        if self.table is not None:
+            return CountScorer(self.table, ciphertext, key)
+        return DeltaScorer(self, ciphertext, key)
+
+    def solve(self, ciphertext, n_iters, verbose=False, seed_parent=None, strategy=None,
+              stagnation=None, deadline=None, callback=None, every=1000, timings=False):
+        """
+        perform a local search on cipher text for at most some number of iterations
+
+        The search stops early, recording why in `self.stop_reason`, once
+            - "stagnation": `stagnation` iterations pass without improving the best key
+            - "deadline": `deadline` seconds of wall-clock time have elapsed
+            - "neighborhood": all 325 swaps of the current key were tried without it moving,
+              i.e. the key is a local optimum; strategies with a `patience` perturb the
+              search instead of stopping
+            - "callback": `callback` returned True
+        and otherwise records "iterations" once all `n_iters` have run. Counters
+        of the search are recorded in `self.stats`, and with `timings` the time
+        spent scoring and updating and the unseen n-grams of the best decryption.
+
+        args:
+            :ciphertext (str) - the encrypted text
+            :n_iters (int) - maximum number of iterations to run
             :verbose (bool) - print verbose outputs
             :seed_parent (str or NoneType) - seed key to use for solution, if None then one will be generated
+            :strategy (.strategy.SearchStrategy, optional) - the search strategy, defaults to hill climbing
+            :stagnation (int > 0 or NoneType) - iterations without improvement after which to stop
+            :deadline (float or NoneType) - wall-clock seconds after which to stop
+            :callback (callable, optional) - called with `self.stats` every `every` iterations, its
+                                             `key` and `fitness` the best so far; returning True stops the search
+            :every (int > 0) - the number of iterations between calls to `callback`
+            :timings (bool) - time the phases of every iteration, e.g. for --stats; off by default
+                              as the clock calls cost a measurable share of an iteration
         returns:
-            :(SubstitutionCipher) - Cipher object containing the final decryption cipher found
-            :(float) - the final fitness of that key
+            :(SubstitutionCipher) - Cipher object containing the best decryption cipher found
+            :(float) - the fitness of that key
 
         raises:
             :AssertionError if `seed` is neither None nor str
         """
         assert isinstance(seed_parent, str) or seed_parent is None, "Bad seed. Expected `str` or `NoneType`"
+        if strategy is None:
+            strategy = HillClimbing()
+        clock = time.perf_counter
+        stats = self.stats = SolveStats()
+        started = clock()
+        if deadline is not None:
+            deadline += started
 
         if seed_parent is None:
             top_key = SubstitutionSolver.generate_parent() 
         else:
             top_key = seed_parent
-        top_fitness = self.score(ciphertext)
-        parent = top_key
+        scorer = self.scorer(ciphertext, top_key)
+        top_fitness = scorer.fitness
         
-        # hill climbing algorithm
-        time_stagnant = i = 0
+        # local search; only the n-grams touched by a swap are rescored
+        self.stop_reason = "iterations"
+        time_stagnant = since_improved = i = 0
+        tried = set() # swaps rejected since the current key last moved
         while i < n_iters:
-            child = SubstitutionSolver.mutate(parent) # randomly modify the parent key
-            decrypted =  SubstitutionCipher(child).decrypt(ciphertext) # decrypt wrt this key
-            child_fitness = self.score(decrypted) # how fit is the key?
-            if child_fitness > top_fitness: # keep top performing keys for future mutation
+            if timings:
+                scoring = clock()
+            if strategy.steepest: # take the best of every swap of the parent key
+                swp1, swp2, gain = scorer.best_swap()
+                stats.score_calls += NEIGHBORHOOD
+            else:                 # randomly modify the parent key
+                swp1, swp2 = SubstitutionSolver.random_swap()
+                gain = scorer.delta(swp1, swp2) # how much fitter is the child?
+                stats.score_calls += 1
+            if timings:
+                updating = clock()
+                stats.time_score += updating - scoring
+            if strategy.accept(gain, i, n_iters):
+                scorer.swap(swp1, swp2)
+                tried.clear()
+                stats.accepted += 1
+                if timings:
+                    stats.time_update += clock() - updating
+            elif strategy.steepest:
+                tried.update(SWAPS)
+            else:
+                tried.add((min(swp1, swp2), max(swp1, swp2)))
+
+            if scorer.fitness > top_fitness: # keep the top performing key
+                top_key, top_fitness = scorer.key, scorer.fitness
+                time_stagnant = since_improved = 0
+                stats.improvements += 1
                 if verbose:
-                    print(f"\r{CLEAR}\r[{i:5d}], fitness: {child_fitness}", end="")
-                parent = child
-                top_key = parent
-                top_fitness = child_fitness
+                    print(f"\r{CLEAR}\r[{i:5d}], fitness: {top_fitness}", end="")
             else:
                 time_stagnant += 1
+                since_improved += 1
 
             i += 1 
+            if callback is not None and i % every == 0:
+                stats.iterations, stats.key, stats.fitness = i, top_key, top_fitness
+                if callback(stats) is True:
+                    self.stop_reason = "callback"
+                    break
+            if len(tried) == NEIGHBORHOOD and strategy.patience is None:
+                self.stop_reason = "neighborhood"
+                break
+            if stagnation is not None and since_improved >= stagnation:
+                self.stop_reason = "stagnation"
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                self.stop_reason = "deadline"
+                break
+            if len(tried) == NEIGHBORHOOD or strategy.stagnated(time_stagnant):
+                # stuck in a local optimum; jump out of it
+                if timings:
+                    updating = clock()
+                scorer = self.scorer(ciphertext, strategy.perturb(top_key))
+                tried.clear()
+                time_stagnant = 0
+                stats.perturbations += 1
+                if timings:
+                    stats.time_update += clock() - updating
+
+        self.iterations = i
+        stats.iterations, stats.key, stats.fitness, stats.stop_reason = i, top_key, top_fitness, self.stop_reason
+        stats.elapsed = clock() - started
+        if timings:
+            stats.unseen = self.unseen(SubstitutionCipher(top_key).decrypt(ciphertext))
         if verbose:
-            print(f"\r{CLEAR}\r[>] Final cipher fitness: {top_fitness}")
+            print(f"\r{CLEAR}\r[>] Final cipher fitness: {top_fitness} "
+                  f"(stopped on {self.stop_reason} after {i} iterations)")
         return SubstitutionCipher(top_key), top_fitness
+
+
+class StagedSubstitutionSolver(object):
+    """
+    Coarse-to-fine solver that climbs with a sequence of SubstitutionSolvers in turn,
+    seeding each with the best key of its predecessor
+
+    Low-order n-gram models are much cheaper to score against and have smoother
+    fitness landscapes, so climbing with e.g. bigrams first reaches a good basin
+    quickly and leaves the expensive high-order model only the final refinement.
+    The fitness reported is that of the last (finest) solver.
+    """
+
+    def __init__(self, solvers):
+        """
+        args:
+            :solvers (list of SubstitutionSolver) - the stages, coarsest first
+        raises:
+            :ValueError if there are no stages
+        """
+        if not solvers:
+            raise ValueError("Expected at least one solver stage")
+        self.solvers = list(solvers)
+        self.stop_reason = None # why the last stage of the last call to `solve` stopped
+        self.iterations = 0     # how many iterations the last call to `solve` ran across all stages
+        self.stats = None       # SolveStats of the last call to `solve`, summed across all stages
+
+    @classmethod
+    def from_model(cls, model, orders=None):
+        """
+        build the stages from the dense tables of a .model.NGramModel
+        args:
+            :model (.model.NGramModel) - the multi-order language model
+            :orders (list of int, optional) - the orders to climb with, coarsest first;
+                                              defaults to every order of the model
+        returns:
+            :(StagedSubstitutionSolver) - the solver
+        """
+        orders = model.orders if orders is None else orders
+        return cls([SubstitutionSolver.from_table(model[order]) for order in orders])
+
+    @property
+    def gram_len(self):
+        return self.solvers[-1].gram_len
+
+    def frequency_parent(self, ciphertext, bigrams=False, alphabet=string.ascii_lowercase):
+        """
+        the frequency analysis key of the finest stage, see SubstitutionSolver.frequency_parent
+        """
+        return self.solvers[-1].frequency_parent(ciphertext, bigrams=bigrams, alphabet=alphabet)
+
+    def score(self, string):
+        """
+        the fitness of a string under the finest stage, see SubstitutionSolver.score
+        """
+        return self.solvers[-1].score(string)
+
+    def solve(self, ciphertext, n_iters, verbose=False, seed_parent=None, **options):
+        """
+        climb through every stage in turn
+        args:
+            :ciphertext (str) - the encrypted text
+            :n_iters (int) - maximum number of iterations to run per stage
+            :verbose (bool) - print verbose outputs
+            :seed_parent (str or NoneType) - seed key of the first stage, if None then one will be generated
+            :**options - keyword arguments passed on to every stage's SubstitutionSolver.solve,
+                         e.g. strategy=; a `deadline` applies to each stage separately, while a
+                         `callback` returning True stops every stage
+        returns:
+            :(SubstitutionCipher) - Cipher object containing the best decryption cipher of the last stage
+            :(float) - the fitness of that key under the last stage's model
+        """
+        key, self.iterations, self.stats = seed_parent, 0, SolveStats()
+        for solver in self.solvers:
+            if verbose:
+                print(f"\r{CLEAR}\r[+] Climbing with {solver.gram_len}-grams", end="")
+            cipher, fitness = solver.solve(ciphertext, n_iters, verbose=verbose, seed_parent=key, **options)
+            key = cipher.key
+            self.iterations += solver.iterations
+            self.stats.update(solver.stats)
+            if solver.stop_reason == "callback":
+                break
+        self.stop_reason = solver.stop_reason
+        return cipher, fitness
+
+
+class PatternSubstitutionSolver(object):
+    """
+    Dictionary attack for short ciphertexts, whose n-gram fitness is too noisy to climb
+
+    A substitution preserves the pattern of repeated letters in a word, e.g. "hello"
+    and its encryption share the pattern ABCCD, so a cipher word can only decrypt to
+    the vocabulary words of its pattern. A depth-first search assigns the cipher words
+    to these candidates, the words with the fewest candidates for their weight first
+    and the most frequent candidates first, and propagates the letters every
+    assignment fixes to the candidates of the remaining words; words left without a
+    candidate, e.g. names missing from the vocabulary, are skipped. The partial key
+    matching the most cipher letters to vocabulary words, each weighted by the log
+    occurrences of its word so that rare tokens do not outweigh common words, is
+    completed by frequency analysis and optionally refined by a hill climb.
+    """
+
+    def __init__(self, vocab, solver=None, max_nodes=10000, max_words=200, deadline=1.0):
+        """
+        args:
+            :vocab (iterable of str or Counter) - the vocabulary of the training corpus, e.g. from
+                                                  .utils.vocabulary, optionally with its occurrences
+            :solver (SubstitutionSolver or StagedSubstitutionSolver, optional) - completes the key by
+                                                                               frequency analysis, scores
+                                                                               it and refines it
+            :max_nodes (int > 0) - bound on the number of partial keys the search tries
+            :max_words (int > 0) - bound on the number of cipher words searched, the longest first
+            :deadline (float or NoneType) - wall-clock seconds after which the search stops
+        """
+        self.counts = vocab if isinstance(vocab, dict) else dict.fromkeys(vocab, 1)
+        self.vocab = set(word for word in self.counts if word.isascii() and word.isalpha())
+        # the index is built lazily, only for the patterns of the cipher words searched, as
+        # building it for every pattern of a large vocabulary takes seconds
+        self._lengths = defaultdict(list) # word length --> vocabulary words not yet grouped by pattern
+        for word in self.vocab:
+            self._lengths[len(word)].append(word)
+        self._patterns = defaultdict(list) # letter pattern --> vocabulary words not yet indexed
+        self.index = {}   # letter pattern --> vocabulary words, most frequent first
+        self.weights = {} # letter pattern --> the weight of matching each of its words, per letter
+        # letter pattern --> per position, plain letter --> bitmask of the pattern's words
+        # with that letter there; the search narrows candidates by and-ing these masks
+        self.masks = {}
+        self.solver = solver
+        self.max_nodes = max_nodes
+        self.max_words = max_words
+        self.deadline = deadline
+        self.nodes = 0          # how many partial keys the last search tried
+        self.matched = 0        # how many cipher letters the last key matched to vocabulary words
+        self.stop_reason = None # "matched" every word, "exhausted" the search, ran out of "nodes" or hit the "deadline"
+        self.stats = None       # SolveStats of the last hill climb
+
+    @staticmethod
+    def pattern(word):
+        """
+        the pattern of repeated letters of a word, e.g. "hello" --> "ABCCD"
+        args:
+            :word (str) - the word
+        returns:
+            :(str) - every letter replaced by the order of its first occurrence
+        """
+        first = {}
+        return "".join(string.ascii_uppercase[first.setdefault(ch, len(first)) % 26] for ch in word)
+
+    @property
+    def gram_len(self):
+        return 1 if self.solver is None else self.solver.gram_len
+
+    def indexed(self, pattern):
+        """
+        index the vocabulary words of a letter pattern, if not yet indexed
+        args:
+            :pattern (str) - the letter pattern, e.g. from `pattern`
+        returns:
+            :(bool) - whether any vocabulary word has the pattern
+        """
+        if pattern in self.index:
+            return True
+        for word in self._lengths.pop(len(pattern), []):
+            self._patterns[PatternSubstitutionSolver.pattern(word)].append(word)
+        if pattern not in self._patterns:
+            return False
+
+        words = sorted(self._patterns.pop(pattern), key=lambda word: (-self.counts[word], word))
+        masks = [defaultdict(int) for _ in pattern]
+        for i, word in enumerate(words):
+            for position, ch in zip(masks, word):
+                position[ch] |= 1 << i
+        self.index[pattern] = words
+        self.weights[pattern] = [log2(1 + self.counts[word]) for word in words]
+        self.masks[pattern] = [dict(position) for position in masks]
+        return True
+
+    def matches(self, cipher, words):
+        """
+        args:
+            :cipher (SubstitutionCipher) - the decryption cipher
+            :words (iterable of str) - the cipher words
+        returns:
+            :(int) - the number of letters of the words that decrypt to vocabulary words
+        """
+        return sum(len(word) for word in set(words) if cipher.decrypt(word) in self.vocab)
+
+    def partial_key(self, words):
+        """
+        search for the partial key that matches the most letters of the cipher words to
+        vocabulary words, weighted by the log occurrences of the words, stopping early
+        once every word is matched, after `max_nodes` or at the `deadline`
+        args:
+            :words (iterable of str) - the cipher words, e.g. the vocabulary of the cleaned ciphertext
+        returns:
+            :(dict of str: str) - the plain letter of every cipher letter the key fixes
+            :(int) - the number of letters of the (distinct) words matched
+        """
+        words = sorted(set(words), key=len, reverse=True)[:self.max_words]
+        patterns = {word: PatternSubstitutionSolver.pattern(word) for word in words}
+        # the candidates of every word, as a bitmask over the vocabulary words of its pattern
+        alive = {word: (1 << len(self.index[patterns[word]])) - 1 for word in words if self.indexed(patterns[word])}
+        total = sum(len(word) for word in words)
+        forward = {} # cipher --> plain letter
+        best = [{}, 0.0, 0] # the key, its weight and the letters it matches
+        self.nodes, self.stop_reason = 0, "exhausted"
+        clock = time.perf_counter
+        deadline = None if self.deadline is None else clock() + self.deadline
+
+        def narrow(alive, fixed):
+            # drop the candidates that decrypt a newly fixed cipher letter to another letter,
+            # or another cipher letter to a newly used plain letter
+            used, narrowed = set(fixed.values()), {}
+            for word, mask in alive.items():
+                for c, position in zip(word, self.masks[patterns[word]]):
+                    if c in fixed:
+                        mask &= position.get(fixed[c], 0)
+                    else:
+                        for p in used:
+                            mask &= ~position.get(p, 0)
+                    if not mask:
+                        break
+                else:
+                    narrowed[word] = mask
+            return narrowed
+
+        def bound(word, mask):
+            # the weight of the most frequent remaining candidate, the lowest bit of the mask
+            return len(word) * self.weights[patterns[word]][(mask & -mask).bit_length() - 1]
+
+        def search(alive, weight, matched):
+            # returns True to stop the whole search
+            if weight > best[1]:
+                best[:] = [dict(forward), weight, matched]
+            if matched == total:
+                self.stop_reason = "matched"
+                return True
+            if self.nodes >= self.max_nodes:
+                self.stop_reason = "nodes"
+                return True
+            if deadline is not None and clock() >= deadline:
+                self.stop_reason = "deadline"
+                return True
+            self.nodes += 1
+            if not alive or weight + sum(bound(word, mask) for word, mask in alive.items()) <= best[1]:
+                return False # cannot outweigh the best key
+
+            # the word with the fewest candidates for the weight at stake
+            word = min(alive, key=lambda word: log2(1 + alive[word].bit_count()) / bound(word, alive[word]))
+            mask, plains, weights = alive[word], self.index[patterns[word]], self.weights[patterns[word]]
+            rest = {other: bits for other, bits in alive.items() if other != word}
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                i = bit.bit_length() - 1
+                fixed = {c: p for c, p in zip(word, plains[i]) if c not in forward}
+                forward.update(fixed)
+                stop = search(narrow(rest, fixed), weight + len(word) * weights[i], matched + len(word))
+                for c in fixed:
+                    del forward[c]
+                if stop:
+                    return True
+            return search(rest, weight, matched) # the word is not in the vocabulary
+
+        search(alive, 0.0, 0)
+        return best[0], best[2]
+
+    def complete(self, partial, ciphertext, alphabet=string.ascii_lowercase):
+        """
+        complete a partial key; the letters it does not fix decrypt as frequency analysis
+        by the solver has them where they are free, otherwise to the free letters in order
+        args:
+            :partial (dict of str: str) - the plain letter of every cipher letter fixed
+            :ciphertext (str) - the encrypted text
+            :alphabet (str, optional) - the ciphertext alphabet
+        returns:
+            :(str) - a cipher key
+        """
+        base = alphabet if self.solver is None else self.solver.frequency_parent(ciphertext, alphabet=alphabet)
+        used, key = set(partial.values()), []
+        for c, p in zip(alphabet, base):
+            if c in partial:
+                key.append(partial[c])
+            elif p not in used:
+                key.append(p)
+                used.add(p)
+            else:
+                key.append(None)
+        spare = iter([p for p in alphabet if p not in used])
+        return "".join(p if p is not None else next(spare) for p in key)
+
+    def solve(self, ciphertext, vocab, n_iters=0, verbose=False, **options):
+        """
+        match the cipher words against the vocabulary, then refine the key with at most
+        `n_iters` iterations of the solver's search. The refined key is kept unless it
+        matches fewer letters to vocabulary words, as n-gram fitness is noisy on short texts
+
+        args:
+            :ciphertext (str) - the cleaned encrypted text
+            :vocab (set of str) - the words of the encrypted text, e.g. from .utils.clean_text(..., return_vocab=True)
+            :n_iters (int) - maximum number of iterations of the refining search, none if 0
+            :verbose (bool) - print verbose outputs
+            :**options - keyword arguments passed on to the solver's `solve`, e.g. strategy=
+        returns:
+            :(SubstitutionCipher) - Cipher object containing the best decryption cipher found
+            :(float) - its fitness under the solver's model, or without a solver the proportion
+                       of the letters of the cipher words matched to vocabulary words
+        """
+        partial, self.matched = self.partial_key(vocab)
+        cipher = SubstitutionCipher(self.complete(partial, ciphertext))
+        self.matched, self.stats = self.matches(cipher, vocab), None
+        if verbose:
+            print(f"\r{CLEAR}\r[+] Matched {self.matched} letters to vocabulary words "
+                  f"(stopped on {self.stop_reason} after {self.nodes} keys)", end="")
+        if self.solver is None:
+            return cipher, self.matched / max(1, sum(len(word) for word in set(vocab)))
+
+        fitness = self.solver.score(cipher.decrypt(ciphertext)) if len(ciphertext) >= self.gram_len else 0.0
+        if n_iters > 0 and len(ciphertext) >= self.gram_len:
+            refined, refined_fitness = self.solver.solve(ciphertext, n_iters, verbose=verbose,
+                                                         seed_parent=cipher.key, **options)
+            self.stats = self.solver.stats
+            matched = self.matches(refined, vocab)
+            if matched >= self.matched:
+                cipher, fitness, self.matched = refined, refined_fitness, matched
+        return cipher, fitness
+
+
+class SolveStats(object):
+    """
+    Counters and timings of a call to SubstitutionSolver.solve
+
+    Swaps are scored incrementally in ciphertext space, so the search never
+    decrypts a text; its time splits into scoring candidate swaps (`time_score`)
+    and applying accepted swaps and perturbations (`time_update`).
+    """
+    COUNTERS = ["iterations", "accepted", "improvements", "perturbations", "score_calls",
+                "time_score", "time_update", "elapsed"]
+
+    def __init__(self):
+        self.iterations = 0      # iterations run
+        self.accepted = 0        # mutations the search moved to
+        self.improvements = 0    # times the best key improved
+        self.perturbations = 0   # times the search was perturbed out of a local optimum
+        self.score_calls = 0     # candidate swaps scored
+        self.unseen = None       # n-grams of the best decryption unseen in the training corpus, if timed
+        self.time_score = 0.0    # seconds spent scoring candidate swaps, if timed
+        self.time_update = 0.0   # seconds spent applying accepted swaps and perturbations, if timed
+        self.elapsed = 0.0       # seconds spent in total
+        self.key = None          # the best key (so far)
+        self.fitness = None      # and its fitness
+        self.stop_reason = None  # why the search stopped
+
+    def update(self, other):
+        """
+        add the counters of a later search to these, e.g. to total the stages of a
+        StagedSubstitutionSolver, whose last stage sets the key, fitness and stop reason
+        args:
+            :other (SolveStats) - the stats of the later search
+        """
+        for name in SolveStats.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.unseen = other.unseen
+        self.key, self.fitness, self.stop_reason = other.key, other.fitness, other.stop_reason
+
+    def as_dict(self):
+        """
+        returns:
+            :(dict) - every counter, timing and result by name, e.g. for json.dump
+        """
+        return dict(vars(self))
+
+    def __str__(self):
+        return (f"{self.__class__.__name__}(iterations={self.iterations}, accepted={self.accepted}, "
+                f"score_calls={self.score_calls}, elapsed={self.elapsed:.3f})")
+
+
+class SolveProgress(object):
+    """
+    A snapshot of a search yielded by solve_async
+    """
+
+    def __init__(self, key, fitness, iteration, done=False, stop_reason=None):
+        self.key = key                   # the best key so far
+        self.fitness = fitness           # and its fitness
+        self.iteration = iteration       # iterations run so far; per stage of a staged solver until done
+        self.done = done                 # whether this is the last snapshot, of the finished search
+        self.stop_reason = stop_reason   # why the search stopped, once done
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(iteration={self.iteration}, fitness={self.fitness}, "
+                f"done={self.done}, stop_reason={self.stop_reason!r})")
+
+
+# state of a worker process of the pools started by _pool, set by _init_worker
+_WORKER_STATE = None
+
+def _init_worker(state):
+    """
+    process pool initializer; stores the shared solver state and reseeds the
+    random module so forked workers do not all climb from the same parents
+    """
+    global _WORKER_STATE
+    _WORKER_STATE = state
+    random.seed()
+
+def _context():
+    """
+    the multiprocessing context of the worker pools; where the platform supports it,
+    workers are forked so the solver and its model are shared copy-on-write rather
+    than pickled to every process
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+def _pool(workers, state=None, executor=False):
+    """
+    start a pool of worker processes, each initialized with the shared state by _init_worker
+    args:
+        :workers (int > 0) - number of processes
+        :state (optional) - the state of the workers, e.g. the solver; must be picklable
+                            where processes cannot be forked
+        :executor (bool) - start a concurrent.futures.ProcessPoolExecutor, e.g. for asyncio,
+                           rather than a multiprocessing.Pool
+    returns:
+        :(multiprocessing.pool.Pool or concurrent.futures.ProcessPoolExecutor) - the pool
+    """
+    if executor:
+        return concurrent.futures.ProcessPoolExecutor(workers, mp_context=_context(), initializer=_init_worker,
+                                                      initargs=(state,))
+    return _context().Pool(workers, initializer=_init_worker, initargs=(state,))
+
+def _restart_worker(_):
+    """
+    run hill climbing restarts until one is accepted or another worker succeeds
+    returns:
+        :(str, float) - the accepted key and its fitness, or None if stopped
+    """
+    solver, ciphertext, n_iters, options, accept, stop, attempts = _WORKER_STATE
+    while not stop.is_set():
+        cipher, fitness = solver.solve(ciphertext, n_iters, **options)
+        with attempts.get_lock():
+            attempts.value += 1
+        if accept(cipher):
+            stop.set()
+            return cipher.key, fitness
+    return None
+
+class ParallelSubstitutionSolver(object):
+    """
+    Runs independent restarts of a SubstitutionSolver across a pool of processes
+
+    Each worker repeatedly climbs from a fresh random parent until a key passes
+    the `accept` check, at which point the remaining workers are cancelled.
+    Where the platform supports it, workers are forked so the n-gram model is
+    shared copy-on-write rather than pickled to every process.
+    """
+
+    def __init__(self, solver, workers=None):
+        """
+        args:
+            :solver (SubstitutionSolver or StagedSubstitutionSolver) - the solver each worker runs
+            :workers (int > 0, optional) - number of processes, defaults to os.cpu_count()
+        """
+        self.solver = solver
+        self.workers = workers or os.cpu_count() or 1
+
+    def solve(self, ciphertext, n_iters, accept, verbose=False, **options):
+        """
+        solve the cipher with restarts spread across the pool
+        args:
+            :ciphertext (str) - the encrypted text
+            :n_iters (int) - number of iterations per restart
+            :accept (callable) - takes a SubstitutionCipher and returns True if it is a solution;
+                                 must be picklable where processes cannot be forked
+            :verbose (bool) - print verbose outputs
+            :**options - keyword arguments passed on to SubstitutionSolver.solve, e.g. strategy=
+        returns:
+            :(SubstitutionCipher) - Cipher object containing the accepted decryption cipher
+            :(float) - the fitness of that key
+            :(int) - the total number of restarts run across all workers
+        """
+        ctx = _context()
+        stop, attempts = ctx.Event(), ctx.Value("i", 0)
+        state = (self.solver, ciphertext, n_iters, options, accept, stop, attempts)
+
+        if verbose:
+            print(f"\r{CLEAR}\r[+] Solving with {self.workers} workers", end="")
+        with _pool(self.workers, state) as pool:
+            for result in pool.imap_unordered(_restart_worker, range(self.workers)):
+                if result is not None:
+                    break
+            pool.terminate()
+
+        key, fitness = result
+        if verbose:
+            print(f"\r{CLEAR}\r[>] Final cipher fitness: {fitness}")
+        return SubstitutionCipher(key), fitness, attempts.value
+
+
+def solve_message(solver, text, n_iters, accept=None, max_attempts=10, start="unigram", patterns=None,
+                  **options):
+    """
+    solve a single raw message, starting from its frequency analysis key (after a dictionary
+    attack on its word patterns, with `patterns`) and restarting at random until `accept`
+    passes it or `max_attempts` attempts have run
+
+    args:
+        :solver (SubstitutionSolver or StagedSubstitutionSolver) - the solver
+        :text (str) - the raw encrypted message; it is cleaned before solving
+        :n_iters (int) - maximum number of iterations per attempt
+        :accept (callable, optional) - takes the vocabulary (set of str) of the message and a
+                                       SubstitutionCipher and returns True if it solves the message.
+                                       If None, the message gets a single attempt, accepted
+        :max_attempts (int > 0) - the maximum number of attempts
+        :start (str) - the first attempt's key; "unigram" or "bigram" frequency analysis, or "random"
+        :patterns (PatternSubstitutionSolver, optional) - makes the first attempt a dictionary attack,
+                                                          refined by `solver`, which it should wrap
+        :**options - keyword arguments passed on to SubstitutionSolver.solve, e.g. strategy=
+    returns:
+        :(SubstitutionCipher) - the accepted (or else fittest) cipher
+        :(float) - its fitness
+        :(int) - the number of attempts
+        :(bool) - whether the cipher was accepted
+    """
+    ciphertext, vocab = clean_text(text, return_vocab=True)
+    if len(ciphertext) < solver.gram_len: # nothing to score
+        return SubstitutionCipher(string.ascii_lowercase), 0.0, 0, False
+    max_attempts = max_attempts if accept is not None else 1
+
+    key = None if start == "random" else solver.frequency_parent(ciphertext, bigrams=start == "bigram")
+    best = None
+    for attempt in range(1, max_attempts + 1):
+        if patterns is not None and attempt == 1:
+            cipher, fitness = patterns.solve(ciphertext, vocab, n_iters, **options)
+        else:
+            cipher, fitness = solver.solve(ciphertext, n_iters, seed_parent=key, **options)
+            key = None # later attempts restart at random
+        if accept is not None and accept(vocab, cipher):
+            return cipher, fitness, attempt, True
+        if best is None or fitness > best[1]:
+            best = (cipher, fitness)
+    return best[0], best[1], max_attempts, accept is None
+
+async def solve_async(solver, ciphertext, n_iters, seed_parent=None, every=1000, deadline=None,
+                      executor=None, **options):
+    """
+    run a search in an executor thread without blocking the event loop, yielding
+    snapshots of its progress as an async iterator:
+
+        async for progress in solve_async(solver, ciphertext, 10000, deadline=5.0):
+            print(progress.iteration, progress.fitness)
+
+    Cancelling the consuming task, e.g. by an enclosing `asyncio.timeout`, or closing
+    the iterator stops the search within `every` iterations; the iterator waits for
+    the thread to stop, so the solver is free for the next search. A solver runs one
+    search at a time.
+
+    args:
+        :solver (SubstitutionSolver or StagedSubstitutionSolver) - the solver
+        :ciphertext (str) - the cleaned encrypted text
+        :n_iters (int) - maximum number of iterations to run (per stage)
+        :seed_parent (str or NoneType) - seed key, if None then one will be generated
+        :every (int > 0) - the number of iterations between snapshots
+        :deadline (float or NoneType) - wall-clock seconds after which to stop (per stage)
+        :executor (concurrent.futures.ThreadPoolExecutor, optional) - runs the search, defaults
+                                                                      to the event loop's; must
+                                                                      be thread based
+        :**options - keyword arguments passed on to the solver's `solve`, e.g. strategy=
+    yields:
+        :(SolveProgress) - the best key so far every `every` iterations, and finally a
+                           snapshot of the finished search with `done` set
+    """
+    loop = asyncio.get_running_loop()
+    snapshots = asyncio.Queue()
+    stop = threading.Event()
+
+    def callback(stats): # runs in the executor thread
+        loop.call_soon_threadsafe(snapshots.put_nowait, SolveProgress(stats.key, stats.fitness, stats.iterations))
+        return stop.is_set()
+
+    search = loop.run_in_executor(executor, functools.partial(solver.solve, ciphertext, n_iters,
+                                                              seed_parent=seed_parent, deadline=deadline,
+                                                              callback=callback, every=every, **options))
+    search.add_done_callback(lambda _: snapshots.put_nowait(None)) # after every snapshot
+    try:
+        while (progress := await snapshots.get()) is not None:
+            yield progress
+        cipher, fitness = await search
+        yield SolveProgress(cipher.key, fitness, solver.iterations, done=True, stop_reason=solver.stop_reason)
+    finally:
+        if not search.done():
+            stop.set()
+            await asyncio.shield(search)
+
+def _batch_message(state, message):
+    """
+    solve one message of a BatchSubstitutionSolver run
+    args:
+        :state (tuple) - the solver, n_iters, accept, max_attempts, start, patterns and options of the run
+        :message (str, str) - the message id and raw text
+    returns:
+        :(str, str, float, int, bool) - the message id, the key and its fitness, the
+                                        number of attempts and whether the key was accepted
+    """
+    solver, n_iters, accept, max_attempts, start, patterns, options = state
+    message_id, text = message
+    cipher, fitness, attempts, accepted = solve_message(solver, text, n_iters, accept,
+                                                        max_attempts, start, patterns, **options)
+    return message_id, cipher.key, fitness, attempts, accepted
+
+def _batch_worker(message):
+    """
+    solve one message in a BatchSubstitutionSolver worker, under the run state set by _init_worker
+    """
+    return _batch_message(_WORKER_STATE, message)
+
+def _message_worker(text, n_iters, max_attempts, start):
+    """
+    solve one message in a .service.SolverService worker, under the (solver, accept, options)
+    state set by _init_worker
+    returns:
+        :(str, float, int, bool) - the key and its fitness, the number of attempts
+                                   and whether the key was accepted
+    """
+    solver, accept, options = _WORKER_STATE
+    cipher, fitness, attempts, accepted = solve_message(solver, text, n_iters, accept,
+                                                        max_attempts, start, **options)
+    return cipher.key, fitness, attempts, accepted
+
+class BatchSubstitutionSolver(object):
+    """
+    Solves many independent messages, each under its own key, across a pool of processes
+
+    The solver and its n-gram model are loaded once and, where the platform supports
+    it, shared copy-on-write with forked workers, so the cost of loading the model
+    and starting processes is paid once for the whole batch rather than per message.
+    """
+
+    def __init__(self, solver, workers=None, chunksize=None, patterns=None):
+        """
+        args:
+            :solver (SubstitutionSolver or StagedSubstitutionSolver) - the solver each worker runs
+            :workers (int > 0, optional) - number of processes, defaults to os.cpu_count();
+                                           a single worker solves in this process
+            :chunksize (int > 0, optional) - the number of messages handed to a worker at a time,
+                                             defaults to a quarter of each worker's share of a batch
+            :patterns (PatternSubstitutionSolver, optional) - wraps `solver` to open every message
+                                                              with a dictionary attack, as `solve_message`
+        """
+        self.solver = solver
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.patterns = patterns
+
+    def solve(self, messages, n_iters, accept=None, max_attempts=10, start="unigram", **options):
+        """
+        solve every message as `solve_message` does, each starting from its frequency analysis
+        key and restarting at random until `accept` passes it or `max_attempts` attempts have run
+
+        args:
+            :messages (iterable of (str, str)) - (id, raw text) of each message, e.g. from .utils.read_messages
+            :n_iters (int) - maximum number of iterations per attempt
+            :accept (callable, optional) - takes the vocabulary (set of str) of a message and a
+                                           SubstitutionCipher and returns True if it solves the message;
+                                           must be picklable where processes cannot be forked.
+                                           If None, every message gets a single attempt, accepted
+            :max_attempts (int > 0) - the maximum number of attempts per message
+            :start (str) - the first attempt's key; "unigram" or "bigram" frequency analysis, or "random"
+            :**options - keyword arguments passed on to SubstitutionSolver.solve, e.g. strategy=
+        yields:
+            :(str, SubstitutionCipher, float, int, bool) - for each message in order, its id, the
+                                                          accepted (or else fittest) cipher and its
+                                                          fitness, the number of attempts and whether
+                                                          the cipher was accepted
+        """
+        state = (self.solver, n_iters, accept, max_attempts, start, self.patterns, options)
+        if self.workers == 1: # the state is bound to this run, so runs may interleave
+            results = map(functools.partial(_batch_message, state), messages)
+        else:
+            messages = list(messages)
+            chunksize = self.chunksize or max(1, len(messages) // (4 * self.workers))
+            pool = _pool(self.workers, state)
+            results = pool.imap(_batch_worker, messages, chunksize=chunksize)
+
+        try:
+            for message_id, key, fitness, attempts, accepted in results:
+                yield message_id, SubstitutionCipher(key), fitness, attempts, accepted
+        finally:
+            if self.workers > 1:
+                pool.terminate()
+
+
+class DeltaScorer(object):
+    """
+    Incremental fitness of a fixed ciphertext under a changing key
+
+    Swapping two letters of a key only changes the decryption of the n-grams
+    that contain either ciphertext letter. On construction the ciphertext is
+    reduced once to its distinct cipher n-grams and their counts, and indexed
+    by letter, mapping each cipher letter to the distinct n-grams containing it,
+    so that a swap is rescored in O(distinct n-grams of two letters) rather
+    than O(len(ciphertext)).
+    """
+
+    def __init__(self, solver, ciphertext, key, alphabet=string.ascii_lowercase):
+        """
+        args:
+            :solver (SubstitutionSolver) - provides the n-gram width and log probabilities
+            :ciphertext (str) - the encrypted text to score
+            :key (str) - the initial decryption key, a permutation of `alphabet`
+            :alphabet (str, optional) - the ciphertext alphabet the key maps from
+        raises:
+            :AssertionError if `key` and `alphabet` differ in length
+        """
+        assert len(key) == len(alphabet), "Bad key; not a 1-1 mapping"
+
+        self.solver = solver
+        self.text = ciphertext
+        self.alphabet = alphabet
+        self._k = list(key)
+
+        n = solver.gram_len
+        self.counts = Counter(ciphertext[s:s+n] for s in range(0, len(ciphertext) - n + 1))
+
+        # cipher letter index --> distinct n-grams containing it
+        self.grams = [[gram for gram in self.counts if ch in gram] for ch in alphabet]
+
+        self._gram_scores = self._score_grams(self._k, self.counts)
+        self.fitness = sum(self.counts[gram] * score for gram, score in self._gram_scores.items())
+        self._pending = None
+
+    @property
+    def key(self):
+        return "".join(self._k)
+
+    def _score_grams(self, key, grams):
+        """
+        score the decryptions of some cipher n-grams under `key`
+        args:
+            :key (list of str) - decryption key
+            :grams (iterable of str) - distinct cipher n-grams
+        returns:
+            :(dict) - mapping from cipher n-gram --> decrypted n-gram (log) probability
+        """
+        table = str.maketrans(self.alphabet, "".join(key))
+        logprob = self.solver.logprob
+        return {gram: logprob(gram.translate(table)) for gram in grams}
+
+    def delta(self, swp1, swp2):
+        """
+        compute the change in fitness caused by swapping two key positions,
+        without committing the swap
+        args:
+            :swp1, swp2 (int) - the key positions to swap
+        returns:
+            :(float) - the fitness of the swapped key minus the current fitness
+        """
+        child = list(self._k)
+        child[swp1], child[swp2] = child[swp2], child[swp1]
+
+        # the n-grams of the first letter, and those of the second that lack the first
+        first = self.alphabet[swp1]
+        affected = self.grams[swp1] + [gram for gram in self.grams[swp2] if first not in gram]
+        rescored = self._score_grams(child, affected)
+        counts, scores = self.counts, self._gram_scores
+        gain = sum(counts[gram] * (score - scores[gram]) for gram, score in rescored.items())
+
+        self._pending = (swp1, swp2, rescored, gain)
+        return gain
+
+    def best_swap(self):
+        """
+        find the swap of two key positions that most improves the fitness; scores the
+        swaps one `delta` at a time, each over the n-grams of its two letters
+        returns:
+            :(int, int, float) - the key positions to swap and the resulting change in fitness
+        """
+        return max(((swp1, swp2, self.delta(swp1, swp2)) for swp1, swp2 in SWAPS),
+                   key=lambda swap: swap[2])
+
+    def swap(self, swp1, swp2):
+        """
+        commit a swap of two key positions, updating the fitness
+        args:
+            :swp1, swp2 (int) - the key positions to swap
+        """
+        if self._pending is None or self._pending[:2] != (swp1, swp2):
+            self.delta(swp1, swp2)
+        _, _, rescored, gain = self._pending
+
+        self._k[swp1], self._k[swp2] = self._k[swp2], self._k[swp1]
+        self._gram_scores.update(rescored)
+        self.fitness += gain
+        self._pending = None
+
+
+
+class CountScorer(object):
+    """
+    Fitness of a fixed ciphertext evaluated entirely in ciphertext space
+
+    The ciphertext is reduced once to the distinct cipher n-grams it contains and
+    their counts. A key is a permutation of the alphabet, so decrypting a cipher
+    n-gram just permutes its digits, and the fitness of a key is the dot product
+    of the cipher n-gram counts with the permuted table log probabilities:
+
+        fitness(key) = sum over cipher grams g of count(g) * logprob(key(g))
+
+    No text is ever decrypted, and the cost of scoring is bounded by the number of
+    distinct cipher n-grams rather than the length of the ciphertext.
+    """
+
+    def __init__(self, table, ciphertext, key):
+        """
+        args:
+            :table (.model.NGramTable) - the dense language model
+            :ciphertext (str) - the encrypted text, consisting only of `table.alphabet` characters
+            :key (str) - the initial decryption key, a permutation of `table.alphabet`
+        raises:
+            :AssertionError if `key` is not a permutation of `table.alphabet`
+        """
+        assert sorted(key) == sorted(table.alphabet), "Bad key; not a 1-1 mapping"
+        np = model.np
+
+        self.table = table
+        grams, self.counts = np.unique(table.codes(table.encode(ciphertext)), return_counts=True)
+
+        # digits[g, d] is the d-th cipher letter of the g-th distinct cipher gram
+        self.digits = (grams[:, None] // table._place) % table.base
+        # places[p, g] sums the place values of the p-th cipher letter's digits in the g-th distinct
+        # cipher gram, so swapping the plaintext of letters p and q moves its table code by
+        # (key[q] - key[p]) * (places[p, g] - places[q, g]); it is zero where p does not occur
+        self.places = np.zeros((table.base, len(grams)), dtype=np.int64)
+        for d, place in enumerate(table._place):
+            self.places[self.digits[:, d], np.arange(len(grams))] += place
+        self.positions = [np.flatnonzero(places) for places in self.places]
+
+        self._k = np.array([table.alphabet.index(ch) for ch in key], dtype=np.int64)
+        self._codes = self.permuted_codes(self._k)
+        self.fitness = self.evaluate(self._codes)
+        self._pending = None
+
+    @property
+    def key(self):
+        return "".join(self.table.alphabet[p] for p in self._k)
+
+    def permuted_codes(self, key, rows=slice(None)):
+        """
+        table codes of the decrypted cipher grams under some key
+        args:
+            :key (numpy.ndarray) - plaintext index of each cipher letter
+            :rows (index, optional) - the distinct cipher grams to decrypt, all by default
+        returns:
+            :(numpy.ndarray of int64) - the table code of each decrypted gram
+        """
+        return key[self.digits[rows]] @ self.table._place
+
+    def evaluate(self, codes, rows=slice(None)):
+        """
+        count-weighted log likelihood of some decrypted cipher grams
+        args:
+            :codes (numpy.ndarray) - table codes of the decrypted grams at `rows`
+            :rows (index, optional) - the distinct cipher grams `codes` belong to
+        returns:
+            :(float) - the log likelihood
+        """
+        return float(self.counts[rows] @ self.table.logprobs[codes].astype(model.np.float64))
+
+    def touched(self, swp1, swp2):
+        """
+        the distinct cipher grams whose decryption a swap of two key positions changes
+        args:
+            :swp1, swp2 (int) - the key positions to swap
+        returns:
+            :(numpy.ndarray of int64) - the grams containing either letter, each once
+        """
+        second = self.positions[swp2]
+        return model.np.concatenate((self.positions[swp1], second[self.places[swp1, second] == 0]))
+
+    def delta(self, swp1, swp2):
+        """
+        compute the change in fitness caused by swapping two key positions,
+        without committing the swap
+        args:
+            :swp1, swp2 (int) - the key positions to swap
+        returns:
+            :(float) - the fitness of the swapped key minus the current fitness
+        """
+        child = self._k.copy()
+        child[swp1], child[swp2] = child[swp2], child[swp1]
+
+        rows = self.touched(swp1, swp2)
+        codes = self.permuted_codes(child, rows)
+        gain = self.evaluate(codes, rows) - self.evaluate(self._codes[rows], rows)
+
+        self._pending = (swp1, swp2, rows, codes, gain)
+        return gain
+
+    def swap_gains(self, swaps):
+        """
+        compute the change in fitness caused by each of many swaps of the current key,
+        without committing any of them; each swap only recodes the grams it touches
+        args:
+            :swaps (sequence of (int, int)) - the key positions to swap
+        returns:
+            :(numpy.ndarray) - the fitness of each swapped key minus the current fitness
+        """
+        logprobs, places, key = self.table.logprobs, self.places, self._k
+        current = self.counts * logprobs[self._codes].astype(model.np.float64)
+
+        gains = model.np.empty(len(swaps))
+        for i, (swp1, swp2) in enumerate(swaps):
+            rows = self.touched(swp1, swp2)
+            codes = self._codes[rows] + (key[swp2] - key[swp1]) * (places[swp1, rows] - places[swp2, rows])
+            gains[i] = self.counts[rows] @ logprobs[codes].astype(model.np.float64) - current[rows].sum()
+        return gains
+
+    def best_swap(self):
+        """
+        find the swap of two key positions that most improves the fitness
+        returns:
+            :(int, int, float) - the key positions to swap and the resulting change in fitness
+        """
+        gains = self.swap_gains(SWAPS)
+        best = int(gains.argmax())
+        return SWAPS[best] + (float(gains[best]),)
+
+    def swap(self, swp1, swp2):
+        """
+        commit a swap of two key positions, updating the fitness
+        args:
+            :swp1, swp2 (int) - the key positions to swap
+        """
+        if self._pending is None or self._pending[:2] != (swp1, swp2):
+            self.delta(swp1, swp2)
+        _, _, rows, codes, gain = self._pending
+
+        self._k[swp1], self._k[swp2] = self._k[swp2], self._k[swp1]
+        self._codes[rows] = codes
+        self.fitness += gain
+        self._pending = None
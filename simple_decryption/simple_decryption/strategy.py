@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Daniel Berenberg
+"""
+simple_decryption search strategy library. Contains the acceptance rules
+and temperature schedules that drive the solvers in .solve
+"""
+import random
+from math import exp, log
+
+__all__ = ["SearchStrategy", "HillClimbing", "SteepestAscent", "SimulatedAnnealing",
+           "ExponentialSchedule", "LinearSchedule", "LogarithmicSchedule",
+           "STRATEGIES", "SCHEDULES"]
+
+
+#### temperature schedules ####
+class ExponentialSchedule(object):
+    """
+    Temperature decaying geometrically from `t0` to `final` over the run
+    """
+
+    def __init__(self, t0=10.0, final=0.01):
+        self.t0, self.final = t0, final
+
+    def __call__(self, i, n_iters):
+        return self.t0 * (self.final / self.t0) ** (i / n_iters)
+
+class LinearSchedule(object):
+    """
+    Temperature decaying linearly from `t0` to 0 over the run
+    """
+
+    def __init__(self, t0=10.0):
+        self.t0 = t0
+
+    def __call__(self, i, n_iters):
+        return self.t0 * (1 - i / n_iters)
+
+class LogarithmicSchedule(object):
+    """
+    Temperature decaying as `t0`/log(i + 2), independent of the run length
+    """
+
+    def __init__(self, t0=10.0):
+        self.t0 = t0
+
+    def __call__(self, i, n_iters):
+        return self.t0 / log(i + 2)
+
+
+#### search strategy hierarchy ####
+class SearchStrategy(object):
+    """
+    SearchStrategy is the base class for all search strategies
+
+    Every strategy has an `accept` method deciding whether the solver moves
+    from its current key to a mutated child, given the change in fitness.
+
+    Strategies that are `steepest` evaluate every swap of the current key at each
+    iteration and only ever consider the best one, rather than a random swap.
+
+    Additionally, strategies may perturb the search once it stagnates: after
+    `patience` consecutive mutations without a new best key, the solver resumes
+    from the best key with `kick` random swaps applied, or from a fresh random
+    key if `kick` is 0.
+    """
+    steepest = False
+
+    def __init__(self, patience=None, kick=3):
+        """
+        args:
+            :patience (int > 0 or NoneType) - mutations without improvement before perturbing; None never perturbs
+            :kick (int >= 0) - random swaps applied to the best key on perturbation, 0 restarts from a random key
+        """
+        self.patience = patience
+        self.kick = kick
+
+    def accept(self, gain, i, n_iters):
+        """
+        args:
+            :gain (float) - the fitness of the child minus that of the current key
+            :i (int) - the current iteration
+            :n_iters (int) - the total number of iterations
+        returns:
+            :(bool) - whether to move to the child
+        """
+        raise NotImplementedError
+
+    def stagnated(self, time_stagnant):
+        """
+        args:
+            :time_stagnant (int) - mutations since the best key last improved
+        returns:
+            :(bool) - whether the search should be perturbed
+        """
+        return self.patience is not None and time_stagnant >= self.patience
+
+    def perturb(self, key):
+        """
+        args:
+            :key (str) - the best key found so far
+        returns:
+            :(str) - the key to resume the search from
+        """
+        child = list(key)
+        if not self.kick:
+            random.shuffle(child)
+        for _ in range(self.kick):
+            swp1, swp2 = random.sample(range(len(child)), 2)
+            child[swp1], child[swp2] = child[swp2], child[swp1]
+        return "".join(child)
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(patience={self.patience}, kick={self.kick})"
+
+class HillClimbing(SearchStrategy):
+    """
+    Greedy hill climbing; only ever moves to strictly fitter keys
+    """
+
+    def accept(self, gain, i, n_iters):
+        return gain > 0
+
+class SteepestAscent(HillClimbing):
+    """
+    Deterministic best-improvement hill climbing; every iteration evaluates all
+    325 swaps of the current key and takes the best, stopping at the first key
+    none of them improves
+    """
+    steepest = True
+
+class SimulatedAnnealing(SearchStrategy):
+    """
+    Simulated annealing; always moves to fitter keys and moves to a less fit
+    key with probability exp(gain / T), where the temperature T follows
+    `schedule` so that the search settles into greedy climbing as T -> 0
+    """
+
+    def __init__(self, schedule=None, patience=None, kick=3):
+        """
+        args:
+            :schedule (callable, optional) - maps (i, n_iters) to a temperature, defaults to ExponentialSchedule()
+            :patience, kick - see SearchStrategy
+        """
+        super().__init__(patience=patience, kick=kick)
+        self.schedule = schedule if schedule is not None else ExponentialSchedule()
+
+    def accept(self, gain, i, n_iters):
+        if gain > 0:
+            return True
+        temperature = self.schedule(i, n_iters)
+        return temperature > 0 and random.random() < exp(gain / temperature)
+
+
+# command line names of the strategies and schedules
+STRATEGIES = {"hill": HillClimbing, "steepest": SteepestAscent, "anneal": SimulatedAnnealing}
+SCHEDULES = {"exponential": ExponentialSchedule,
+             "linear": LinearSchedule,
+             "logarithmic": LogarithmicSchedule}
@@ -6,13 +6,25 @@
 Helper library for simple_decryption lib.
 """
 import re
+import json
 import pickle
 import string
+import codecs
+import hashlib
+import secrets
+import functools
+import contextlib
 import sys, os
 from math import log2
 from collections import Counter
 
-__all__ = ["cache_pickle","chunks","clean","ngram_distribution"]
+__all__ = ["cache_pickle","cached","atomic_write","digest","cache_filename",
+           "chunks","corpus_files","read_chunks","read_range","read_messages",
+           "clean","clean_text","vocabulary","ngram_distribution"]
+
+BUFFER_SIZE = 1 << 20 # characters read at a time when streaming files
+FILTER = "[^A-Za-z]"  # the characters `clean` removes by default
+DIGESTS = "digests.json" # the sidecar of corpus file digests `digest` keeps in a cache directory
 
 #### helper functions ####
 def cache_pickle(handler):
@@ -41,21 +53,157 @@ def cache_pickle(handler):
     and call it in the following way, assuming we'd like to cache outputs to 'mypickle.bin':
 
     >>> comp_intensive_func('mypickle.bin', arg1, arg2, ...)
+
+    The undecorated function remains available as `comp_intensive_func.__wrapped__`.
     """
+    @functools.wraps(handler)
     def wrapper(filename, *args, **kwargs):
-        try:
-            with open(filename, "rb") as pkf:
-                #print("{} is cached!".format(filename), file=sys.stderr)
-                return pickle.load(pkf)
-        except FileNotFoundError: # the pickle was not found
-            out = handler(*args, **kwargs)
-            with open(filename, "wb") as pkf:
-                pickle.dump(out, pkf)
-                #print("cached content to {}".format(filename), file=sys.stderr)
-        return out
+        return cached(filename, lambda: handler(*args, **kwargs))
     
     return wrapper
 
+def cached(filename, compute):
+    """
+    load data pickled at `filename`, or compute and pickle it if it is not cached.
+    Unlike `cache_pickle`, the inputs of the computation are only prepared on a
+    cache miss, as `compute` takes no arguments
+
+    args:
+        :filename (str) - the path of the pickle
+        :compute (callable) - takes no arguments and returns the data
+    returns:
+        :the cached data
+
+    usage:
+
+    >>> vocab = cached("vocab.bin", lambda: clean("corpus.txt", return_vocab=True)[1])
+    """
+    try:
+        with open(filename, "rb") as pkf:
+            #print("{} is cached!".format(filename), file=sys.stderr)
+            return pickle.load(pkf)
+    except FileNotFoundError: # the pickle was not found
+        out = compute()
+        with atomic_write(filename) as pkf:
+            pickle.dump(out, pkf)
+            #print("cached content to {}".format(filename), file=sys.stderr)
+    return out
+
+@contextlib.contextmanager
+def atomic_write(filename, mode="wb"):
+    """
+    context manager for writing a file atomically; the content is written to a
+    temporary file in the same directory that replaces `filename` only once it
+    is complete, so concurrent readers see either no file or the whole file
+
+    args:
+        :filename (str) - the path to write
+        :mode (str) - the mode in which to open the temporary file
+    yields:
+        :the open temporary file
+
+    usage:
+
+    >>> with atomic_write("mypickle.bin") as f:
+    >>>     pickle.dump(data, f)
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    tmpname = os.path.join(directory, f".{name}.{os.getpid()}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(tmpname, mode.replace("w", "x")) as tmp:
+            yield tmp
+        os.replace(tmpname, filename)
+    except BaseException:
+        if os.path.exists(tmpname):
+            os.unlink(tmpname)
+        raise
+
+def digest(filename, *params, cache=None):
+    """
+    hash the contents of a file along with some parameters; the file itself is
+    only read once per process for as long as it is not modified, and with a
+    `cache` directory only once at all, as the digests of its contents are kept
+    in a sidecar there keyed by path, size and modification time
+    args:
+        :filename (str) - preverified path to a file or directory of files
+        :*params - reprable values that also determine the key, e.g. n-gram width
+        :cache (str, optional) - existing directory in which to persist the file digests
+    returns:
+        :(str) - the hex SHA-256 digest
+    """
+    sidecar = os.path.join(cache, DIGESTS) if cache is not None else None
+    known = _read_digests(sidecar) if sidecar is not None else {}
+    changed = False
+
+    sha = hashlib.sha256()
+    for path in corpus_files(filename): # a directory hashes as its files, in order
+        stat, key = os.stat(path), os.path.abspath(path)
+        entry = known.get(key)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            contents = bytes.fromhex(entry[2])
+        else:
+            contents = file_digest(key, stat.st_mtime_ns, stat.st_size)
+            known[key], changed = [stat.st_size, stat.st_mtime_ns, contents.hex()], True
+        sha.update(os.path.relpath(path, filename).encode())
+        sha.update(contents)
+    sha.update(repr(params).encode())
+
+    if changed and sidecar is not None:
+        with atomic_write(sidecar, "wt") as f:
+            json.dump(known, f)
+    return sha.hexdigest()
+
+def _read_digests(sidecar):
+    """
+    internal helper of `digest`, reads a sidecar of file digests
+    returns:
+        :(dict) - absolute path --> [size, modification time in ns, hex SHA-256 digest],
+                  empty if the sidecar is missing or unreadable
+    """
+    try:
+        with open(sidecar, "rt") as f:
+            known = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return known if isinstance(known, dict) else {}
+
+@functools.lru_cache(maxsize=None)
+def file_digest(filename, mtime, size):
+    """
+    internal helper of `digest`, memoized on the file's modification time and size
+    returns:
+        :(bytes) - the SHA-256 digest of the file contents
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+            sha.update(block)
+    return sha.digest()
+
+def cache_filename(directory, prefix, corpus, extension, **params):
+    """
+    build a content-addressed cache path for data computed from a corpus, so that
+    caches of different corpora or parameters never collide and stale caches are
+    never reused; the corpus digest is persisted in `directory`, so a warm start
+    only stats the corpus
+
+    args:
+        :directory (str) - the cache directory
+        :prefix (str) - human readable start of the file name, e.g. "4-grams"
+        :corpus (str) - preverified path to the corpus the data is computed from
+        :extension (str) - the file extension
+        :**params - the parameters the data is computed with
+    returns:
+        :(str) - the path "{directory}/{prefix}-{digest}.{extension}"
+
+    usage:
+
+    >>> cache_filename("ngrams", "4-grams", "corpus.txt", "bin", n=4, log=True, filt=FILTER)
+        'ngrams/4-grams-1f3a6b0c9d2e4f51.bin'
+    """
+    key = digest(corpus, sorted(params.items()), cache=directory)
+    return os.path.join(directory, f"{prefix}-{key[:16]}.{extension}")
+
 def chunks(item,chunksize):
     """
     Step through `item`, generating `chunksize` chunks of it. Throw out the last bit
@@ -93,27 +241,152 @@ def chunks(item,chunksize):
             yield chunk
 
  
-def clean(filename,filt="[^A-Za-z]",return_vocab=False):
+def corpus_files(path):
     """
-    clean a text corpus by removing chars based on the regex defined in `filt`
+    list the files of a corpus, which is either a single file or a directory of
+    files read in sorted order as if they were concatenated
+    args:
+        :path (str) - preverified path to a file or directory
+    returns:
+        :(list of str) - the paths of the corpus files
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))
+            if not name.startswith(".") and os.path.isfile(os.path.join(path, name))]
+
+def read_chunks(filename, size=BUFFER_SIZE):
+    """
+    Step through a text file, or a directory of them, generating `size` character chunks of it
+    args:
+        :filename (str) - preverified path to text file or directory of text files
+        :size (int > 0) - the maximum number of characters per chunk
+    yields:
+        :(str) chunks of the file(s), in order; chunks do not span files
+    """
+    for path in corpus_files(filename):
+        with open(path, "rt") as f:
+            for chunk in iter(lambda: f.read(size), ""):
+                yield chunk
+
+def read_range(filename, start=0, end=None, size=BUFFER_SIZE, encoding="utf-8"):
+    """
+    Step through the bytes [start, end) of a text file, generating decoded chunks of it
     args:
         :filename (str) - preverified path to text file
+        :start, end (int or NoneType) - the byte range to read, to the end of the file if `end` is None
+        :size (int > 0) - the number of bytes read at a time
+        :encoding (str) - the text encoding; characters cut by the range boundaries are dropped
+    yields:
+        :(str) the decoded chunks, in order
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    with open(filename, "rb") as f:
+        f.seek(start)
+        remaining = float("inf") if end is None else end - start
+        while remaining > 0:
+            block = f.read(int(min(size, remaining)))
+            if not block:
+                break
+            remaining -= len(block)
+            yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+def read_messages(path):
+    """
+    Step through a collection of independent messages, which is either a directory
+    with one message per file or a JSON lines file of objects with a "ciphertext"
+    (or "text") member and an optional "id"
+    args:
+        :path (str) - preverified path to the directory or JSON lines file
+    yields:
+        :(str, str) the id of each message, its file name or "id" (defaulted to its
+                    line number), and its text; in order
+    raises:
+        :ValueError for a JSON line without text
+    """
+    if os.path.isdir(path):
+        for filename in corpus_files(path):
+            with open(filename, "rt") as f:
+                yield os.path.basename(filename), f.read()
+        return
+
+    with open(path, "rt") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            text = message.get("ciphertext", message.get("text"))
+            if text is None:
+                raise ValueError(f"Expected a \"ciphertext\" on line {number} of {path}")
+            yield str(message.get("id", number)), text
+
+def clean(filename,filt=FILTER,return_vocab=False,limit=None):
+    """
+    clean a text corpus by removing chars based on the regex defined in `filt`
+    args:
+        :filename (str) - preverified path to text file, or directory of them if there is no `limit`
         :filt (str, regex) - the regex to off of whic to base cleaning operation
         :return_vocab (bool) - return the text vocabulary, all unique types of the corpus 
+        :limit (int > 0 or NoneType) - only clean a sample of about the first `limit` characters,
+                                       cut back to the last whitespace so no word is split
+                                       (kept whole if it has none)
     returns:
         :(str) - the cleaned text, all lowercase
         :(set of str) - if return_vocab enabled, the set of unique tokens of the corpus
     """
-    with open(filename, "rt") as f:
-        text = f.read()
-        if return_vocab:
-            text = re.sub(filt, " ", text).lower()
-            voc = set(text.split())
-            text = re.sub(" ", "", text)
-            return text, voc
-        else:
-            text = re.sub(filt, "", text).lower()
-            return text
+    if limit is None:
+        text = "".join(read_chunks(filename))
+    else:
+        with open(filename, "rt") as f:
+            text = f.read(limit)
+            if f.read(1) and text and not text[-1].isspace():
+                cut = re.search(r"\s\S*\Z", text)
+                if cut is not None and cut.start() > 0:
+                    text = text[:cut.start()]
+    return clean_text(text, filt=filt, return_vocab=return_vocab)
+
+def clean_text(text,filt=FILTER,return_vocab=False):
+    """
+    clean a text already in memory, as `clean` does a file
+    args:
+        :text (str) - the text to clean
+        :filt (str, regex) - the regex to off of which to base cleaning operation
+        :return_vocab (bool) - return the text vocabulary, all unique types of the text
+    returns:
+        :(str) - the cleaned text, all lowercase
+        :(set of str) - if return_vocab enabled, the set of unique tokens of the text
+    """
+    if return_vocab:
+        text = re.sub(filt, " ", text).lower()
+        voc = set(text.split())
+        text = re.sub(" ", "", text)
+        return text, voc
+    else:
+        text = re.sub(filt, "", text).lower()
+        return text
+
+def vocabulary(filename,filt=FILTER,size=BUFFER_SIZE,counts=False):
+    """
+    stream a text corpus for its vocabulary, as returned by `clean`, in constant memory
+    args:
+        :filename (str) - preverified path to text file
+        :filt (str, regex) - the regex to off of which to base cleaning operation
+        :size (int > 0) - the number of characters read at a time
+        :counts (bool) - also count the occurrences of every token
+    returns:
+        :(set of str) - the set of unique tokens of the corpus, all lowercase; with
+                        `counts`, a Counter of token --> occurrences instead
+    """
+    filt = re.compile(filt)
+    vocab, carry = Counter(), ""
+    for chunk in read_chunks(filename, size):
+        tokens = (carry + filt.sub(" ", chunk).lower()).split(" ")
+        carry = tokens.pop() # may continue into the next chunk
+        vocab.update(token for token in tokens if token)
+    if carry:
+        vocab[carry] += 1
+    return vocab if counts else set(vocab)
 
 @cache_pickle
 def ngram_distribution(text,n=1, log=True):